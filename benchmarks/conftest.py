@@ -0,0 +1,126 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import pye57
+
+CARTESIAN_FIELDS = ["cartesianX", "cartesianY", "cartesianZ"]
+COLOR_FIELDS = ["colorRed", "colorGreen", "colorBlue"]
+
+# point fields of the synthetic scans, selected with --e57-layout
+FIELD_LAYOUTS = {
+    "xyz": CARTESIAN_FIELDS,
+    "xyzi": CARTESIAN_FIELDS + ["intensity"],
+    "xyzrgb": CARTESIAN_FIELDS + COLOR_FIELDS,
+    "full": CARTESIAN_FIELDS + ["intensity"] + COLOR_FIELDS + ["rowIndex", "columnIndex", "cartesianInvalidState"],
+}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("pye57 benchmarks")
+    group.addoption("--e57-points", type=int, default=1_000_000, help="number of points of each synthetic scan")
+    group.addoption("--e57-scans", type=int, default=2, help="number of scans of the synthetic file")
+    group.addoption("--e57-layout", choices=list(FIELD_LAYOUTS), default="full",
+                    help="point fields of the synthetic scans")
+    group.addoption("--e57-precision", choices=["single", "double"], default="single",
+                    help="precision of the coordinates of the synthetic scans")
+
+
+def synthetic_scan(n_points, fields, seed=0):
+    """Generates the raw fields of a scan on a 1000 columns grid, with 5% of invalid points."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for field in fields:
+        if field in CARTESIAN_FIELDS:
+            data[field] = rng.uniform(-50, 50, n_points)
+        elif field == "intensity":
+            data[field] = rng.random(n_points, np.float32)
+        elif field in COLOR_FIELDS:
+            data[field] = rng.integers(0, 256, n_points, np.uint8)
+        elif field == "rowIndex":
+            data[field] = (np.arange(n_points) // 1000).astype(np.uint16)
+        elif field == "columnIndex":
+            data[field] = (np.arange(n_points) % 1000).astype(np.uint16)
+        elif field == "cartesianInvalidState":
+            data[field] = (rng.random(n_points) < 0.05).astype(np.int8)
+    return data
+
+
+@pytest.fixture(scope="session")
+def e57_options(request):
+    return {
+        "points": request.config.getoption("--e57-points"),
+        "scans": request.config.getoption("--e57-scans"),
+        "layout": request.config.getoption("--e57-layout"),
+        "precision": request.config.getoption("--e57-precision"),
+    }
+
+
+@pytest.fixture(scope="session")
+def scan_data(e57_options):
+    return synthetic_scan(e57_options["points"], FIELD_LAYOUTS[e57_options["layout"]])
+
+
+@pytest.fixture(scope="session")
+def synthetic_e57(tmp_path_factory, e57_options, scan_data):
+    """Path of a synthetic E57 file, written with write_scan_raw."""
+    path = str(tmp_path_factory.mktemp("e57") / "synthetic.e57")
+    with pye57.E57(path, mode="w") as e57:
+        for index in range(e57_options["scans"]):
+            e57.write_scan_raw(scan_data,
+                               name="scan %s" % index,
+                               rotation=np.array([1.0, 0.0, 0.0, 0.0]),
+                               translation=np.array([index * 100.0, 0.0, 0.0]),
+                               precision=e57_options["precision"])
+    return path
+
+
+def reset_peak_rss():
+    # on linux, writing 5 to clear_refs resets the peak resident set size of the process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmarks a function that processes `n_points` points, and reports points/s and peak RSS."""
+    def run(function, n_points, rounds=3):
+        reset_peak_rss()
+        result = benchmark.pedantic(function, rounds=rounds, iterations=1, warmup_rounds=1)
+        benchmark.extra_info["points"] = n_points
+        # there are no statistics with --benchmark-disable
+        if benchmark.stats is not None:
+            benchmark.extra_info["points_per_second"] = n_points / benchmark.stats.stats.mean
+        benchmark.extra_info["peak_rss_mb"] = peak_rss_mb()
+        return result
+    return run
+
+
+@pytest.fixture
+def temp_e57(tmp_path):
+    path = str(tmp_path / "output.e57")
+    yield path
+    if os.path.exists(path):
+        os.remove(path)
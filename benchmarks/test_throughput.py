@@ -0,0 +1,61 @@
+"""Throughput benchmarks, run with:
+
+    python -m pytest benchmarks --e57-points 10000000 --benchmark-json results.json
+
+Each benchmark reports the points processed per second and the peak resident memory
+of the process in its `extra_info`.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import pye57
+
+
+def test_read_scan(measure, synthetic_e57, e57_options):
+    def read():
+        with pye57.E57(synthetic_e57) as e57:
+            return [e57.read_scan(index, intensity=True, colors=True, ignore_missing_fields=True)
+                    for index in range(e57.scan_count)]
+    measure(read, e57_options["points"] * e57_options["scans"])
+
+
+def test_read_scan_raw(measure, synthetic_e57, e57_options):
+    def read():
+        with pye57.E57(synthetic_e57) as e57:
+            return [e57.read_scan_raw(index) for index in range(e57.scan_count)]
+    measure(read, e57_options["points"] * e57_options["scans"])
+
+
+def test_read_scan_without_checksums(measure, synthetic_e57, e57_options):
+    def read():
+        with pye57.E57(synthetic_e57, checksum_policy="none") as e57:
+            return [e57.read_scan_raw(index) for index in range(e57.scan_count)]
+    measure(read, e57_options["points"] * e57_options["scans"])
+
+
+def test_write_scan_raw(measure, scan_data, e57_options, temp_e57):
+    def write():
+        with pye57.E57(temp_e57, mode="w") as e57:
+            e57.write_scan_raw(scan_data, precision=e57_options["precision"])
+    measure(write, e57_options["points"])
+
+
+def test_header_access(benchmark, synthetic_e57):
+    def read_headers():
+        with pye57.E57(synthetic_e57) as e57:
+            return [(header.point_count, header.point_fields, header.rotation, header.translation,
+                     header.xMinimum, header.xMaximum) for header in e57.get_headers()]
+    headers = benchmark(read_headers)
+    if benchmark.stats is not None:
+        benchmark.extra_info["headers_per_second"] = len(headers) / benchmark.stats.stats.mean
+
+
+def test_clone(measure, synthetic_e57, e57_options, temp_e57):
+    measure(lambda: pye57.clone(synthetic_e57, temp_e57), e57_options["points"] * e57_options["scans"])
+
+
+def test_clone_transform(measure, synthetic_e57, e57_options, temp_e57):
+    def clone():
+        pye57.clone(synthetic_e57, temp_e57, transform=([1, 0, 0, 0], [10, 0, 0]))
+    measure(clone, e57_options["points"] * e57_options["scans"])
@@ -134,7 +134,7 @@ setup(
     package_dir={"": "src"},
     # include_package_data=True,
     package_data={"pye57": package_data},
-    extras_require={"test": "pytest"},
+    extras_require={"test": "pytest", "arrow": "pyarrow"},
     license="MIT",
     classifiers=[
         "License :: OSI Approved :: MIT License",
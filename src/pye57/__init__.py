@@ -1,3 +1,9 @@
 from pye57 import libe57
-from pye57.scan_header import ScanHeader
+from pye57.scan_header import ScanHeader, ScanHeaderSnapshot
+from pye57.image_header import ImageHeader
 from pye57.e57 import E57
+from pye57.async_e57 import AsyncE57
+from pye57.decimation import Decimator, RandomSample, Stride, VoxelGrid
+from pye57.file_index import index_file
+from pye57.cache import DiskScanCache, ScanCache
+from pye57.utils import clone
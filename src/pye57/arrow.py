@@ -0,0 +1,100 @@
+"""Conversion of decoded scans to Apache Arrow.
+
+pyarrow is an optional dependency, installed with `pip install pye57[arrow]`.
+"""
+import json
+from typing import Dict
+
+import numpy as np
+
+from pye57 import libe57
+from pye57.utils import get_fields
+
+NodeType = libe57.NodeType
+
+# units of the point fields defined by the E57 standard
+FIELD_UNITS = {
+    "cartesianX": "m",
+    "cartesianY": "m",
+    "cartesianZ": "m",
+    "sphericalRange": "m",
+    "sphericalAzimuth": "rad",
+    "sphericalElevation": "rad",
+    "timeStamp": "s",
+}
+
+# structures of the scan header copied to the schema metadata, when they are defined
+SCAN_BOUNDS = ["cartesianBounds", "sphericalBounds", "indexBounds", "intensityLimits", "colorLimits"]
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required to read scans as Arrow data, "
+                          "install it with: pip install pye57[arrow]") from None
+    return pyarrow
+
+
+def field_metadata(header, field) -> Dict[str, str]:
+    """Returns the unit of a point field, and how it is stored in the file (type, limits, scale and offset)."""
+    metadata = {}
+    if field in FIELD_UNITS:
+        metadata["unit"] = FIELD_UNITS[field]
+    if field not in header.point_fields:
+        return metadata
+    node = header.prototype.get(field)
+    node_type = node.type()
+    if node_type == NodeType.E57_SCALED_INTEGER:
+        node = libe57.ScaledIntegerNode(node)
+        metadata["e57:type"] = "ScaledInteger"
+        metadata["e57:scale"] = repr(node.scale())
+        metadata["e57:offset"] = repr(node.offset())
+    elif node_type == NodeType.E57_INTEGER:
+        node = libe57.IntegerNode(node)
+        metadata["e57:type"] = "Integer"
+    elif node_type == NodeType.E57_FLOAT:
+        node = libe57.FloatNode(node)
+        metadata["e57:type"] = "Float"
+        metadata["e57:precision"] = "single" if node.precision() == libe57.E57_SINGLE else "double"
+    else:
+        return metadata
+    # raw values for scaled integers
+    metadata["e57:minimum"] = repr(node.minimum())
+    metadata["e57:maximum"] = repr(node.maximum())
+    return metadata
+
+
+def scan_metadata(header, index, transform) -> Dict[str, str]:
+    """Returns the identity, pose and bounds of a scan, the structures are encoded as json."""
+    metadata = {
+        "e57:scan_index": str(index),
+        # the points are in the coordinate system of the file when they are transformed
+        "e57:coordinate_system": "file" if transform else "scan",
+    }
+    for name in ["guid", "name", "description"]:
+        if header.node.isDefined(name):
+            metadata["e57:" + name] = str(header[name].value())
+    if header.has_pose():
+        metadata["e57:rotation"] = json.dumps(header.rotation.tolist())
+        metadata["e57:translation"] = json.dumps(header.translation.tolist())
+    for name in SCAN_BOUNDS:
+        if header.node.isDefined(name):
+            bounds = header[name]
+            metadata["e57:" + name] = json.dumps({child: bounds[child].value() for child in get_fields(bounds)})
+    return metadata
+
+
+def scan_schema(header, index, data: Dict[str, np.ndarray], transform=True):
+    """Returns the Arrow schema of the points read from a scan, with the metadata of the scan and its fields."""
+    pa = import_pyarrow()
+    fields = [pa.field(name, pa.from_numpy_dtype(array.dtype), nullable=False, metadata=field_metadata(header, name))
+              for name, array in data.items()]
+    return pa.schema(fields, metadata=scan_metadata(header, index, transform))
+
+
+def record_batch(data: Dict[str, np.ndarray], schema):
+    """Wraps the arrays of a scan in a record batch, without copying them."""
+    pa = import_pyarrow()
+    # numeric arrays without a mask are used as Arrow buffers as they are
+    return pa.RecordBatch.from_arrays([pa.array(data[field.name], field.type) for field in schema], schema=schema)
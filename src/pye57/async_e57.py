@@ -0,0 +1,147 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict
+
+from pye57 import libe57
+from pye57.e57 import DEFAULT_CHUNK_SIZE, E57
+
+# number of decoded chunks waiting for the consumer of aiter_scan
+DEFAULT_BUFFERED_CHUNKS = 2
+
+
+class AsyncE57:
+    """Reads an E57 file from asyncio code, without blocking the event loop.
+
+    The points are decoded by libE57Format in a background thread, which releases the GIL.
+    An image file can't be used by several threads at once, so each file has its own
+    single thread executor and its calls are run one after the other.
+
+        async with pye57.AsyncE57("e57_file.e57") as e57:
+            data = await e57.aread_scan(0, intensity=True)
+            async for chunk in e57.aiter_scan(1, chunk_size=100_000):
+                ...
+
+    The wrapped `E57` is available as `e57`, e.g. to read the headers.
+    """
+    def __init__(self, path, checksum_policy=libe57.CHECKSUM_POLICY_ALL, cache=None):
+        self.e57 = E57(path, checksum_policy=checksum_policy, cache=cache)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pye57")
+        # tasks decoding the chunks of the iterators that are still open
+        self._producers = set()
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    @property
+    def scan_count(self):
+        return self.e57.scan_count
+
+    def get_header(self, index):
+        return self.e57.get_header(index)
+
+    def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def aread_scan(self, index, **kwargs) -> Dict:
+        """Reads a scan in the background thread, with the arguments of `E57.read_scan`.
+
+        Cancelling the call doesn't interrupt the decoding, its result is dropped.
+        """
+        return await self._run(self.e57.read_scan, index, **kwargs)
+
+    async def aread_scan_raw(self, index, **kwargs) -> Dict:
+        """Reads the raw point fields of a scan, with the arguments of `E57.read_scan_raw`."""
+        return await self._run(self.e57.read_scan_raw, index, **kwargs)
+
+    def aiter_scan(self,
+                   index,
+                   *,
+                   chunk_size=DEFAULT_CHUNK_SIZE,
+                   max_buffered_chunks=DEFAULT_BUFFERED_CHUNKS,
+                   **kwargs) -> AsyncIterator[Dict]:
+        """Reads a scan in chunks of at most `chunk_size` points, with the arguments of `E57.iter_scan`.
+
+        The next chunks are decoded while the current one is processed, so a slow consumer doesn't
+        buffer the whole scan: at most `max_buffered_chunks` chunks are decoded, or being decoded,
+        ahead of the one the consumer has.
+        Closing the iterator, or cancelling the task while it waits for a chunk, closes the reader of the scan.
+        An iterator left before its end is closed when it is garbage collected, use
+        `async with contextlib.aclosing(e57.aiter_scan(...))` to close it at once.
+        """
+        chunks = self.e57.iter_scan(index, chunk_size=chunk_size, **kwargs)
+        return self._chunks_from_executor(chunks, max_buffered_chunks)
+
+    def aiter_scan_raw(self,
+                       index,
+                       *,
+                       chunk_size=DEFAULT_CHUNK_SIZE,
+                       max_buffered_chunks=DEFAULT_BUFFERED_CHUNKS,
+                       **kwargs) -> AsyncIterator[Dict]:
+        """Reads the raw point fields of a scan in chunks, with the arguments of `E57.iter_scan_raw`."""
+        chunks = self.e57.iter_scan_raw(index, chunk_size=chunk_size, **kwargs)
+        return self._chunks_from_executor(chunks, max_buffered_chunks)
+
+    async def _chunks_from_executor(self, chunks, max_buffered_chunks):
+        if max_buffered_chunks < 1:
+            raise ValueError("max_buffered_chunks must be a positive integer")
+        queue = asyncio.Queue()
+        # a slot is taken before a chunk is decoded, and freed when the consumer gets it
+        slots = asyncio.Semaphore(max_buffered_chunks)
+
+        async def produce():
+            try:
+                while True:
+                    await slots.acquire()
+                    chunk = await self._run(next, chunks, None)
+                    queue.put_nowait(chunk)
+                    if chunk is None:
+                        break
+            except asyncio.CancelledError:
+                # the consumer is gone, or the file is being closed under it
+                queue.put_nowait(ValueError("The file was closed while the scan was read"))
+                raise
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                # the executor runs one call at a time, so the generator is closed after the chunk
+                # being decoded, and closing the generator closes its reader
+                await asyncio.shield(self._run(chunks.close))
+
+        producer = asyncio.ensure_future(produce())
+        self._producers.add(producer)
+        try:
+            while True:
+                chunk = await queue.get()
+                slots.release()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            producer.cancel()
+            await asyncio.wait([producer])
+            self._producers.discard(producer)
+
+    async def aclose(self):
+        """Stops the iterators that are still reading, then closes the file.
+
+        An iterator used by another task raises a ValueError once its reader is closed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        producers = list(self._producers)
+        for producer in producers:
+            producer.cancel()
+        if producers:
+            # the readers are closed before the file
+            await asyncio.wait(producers)
+        await self._run(self.e57.close)
+        self._executor.shutdown()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+
+import numpy as np
+
+# lists the fields of a cache entry, in the order of their .npy files
+FIELDS_FILE = "fields.json"
+# prefix of the directories where the entries are written before they appear in the cache
+TEMP_PREFIX = ".tmp-"
+# seconds after which a temporary directory is assumed to be left by a crashed process
+STALE_TEMP_AGE = 3600
+
+
+class ScanCache:
+    """Keeps decoded scans in memory, and returns the same read-only arrays for the same scan and options.
+
+    Pass it as `E57(path, cache=ScanCache(max_bytes))`: `read_scan` and `read_scan_raw`
+    first look for the points in the cache, and keep them after decoding them otherwise.
+    When `max_bytes` is given, the least recently used entries are removed to stay below it,
+    and scans larger than `max_bytes` are not kept. The cache can be shared by several files and threads.
+
+    `hits`, `misses` and `evictions` count the lookups that found an entry, the lookups that didn't
+    and the entries removed to make room for new ones.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> Dict[str, np.ndarray]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        # a new dictionary, so that callers can't remove the fields of the entry
+        return dict(data)
+
+    def put(self, key, data: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Keeps the arrays of a scan, and returns them as read-only arrays."""
+        for array in data.values():
+            array.flags.writeable = False
+        size = sum(array.nbytes for array in data.values())
+        if self.max_bytes is not None and size > self.max_bytes:
+            return dict(data)
+        with self._lock:
+            if key in self._entries:
+                self.size -= sum(array.nbytes for array in self._entries.pop(key).values())
+            self._entries[key] = dict(data)
+            self.size += size
+            while self.max_bytes is not None and self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sum(array.nbytes for array in evicted.values())
+                self.evictions += 1
+        return dict(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskScanCache:
+    """Keeps decoded scans on disk, as one .npy file per field, and returns them as memory maps.
+
+    Pass it as `E57(path, cache=DiskScanCache(directory))`: `read_scan` and `read_scan_raw`
+    first look for the points in the cache, and save them after decoding them otherwise.
+    Entries are keyed by the identity of the file (path, size and modification time), the guid
+    of the scan and the reading options. The arrays are read-only memory maps, so their pages
+    are shared by all the processes that read the same entry.
+
+    When `max_bytes` is given, the least recently used entries are removed to stay below it.
+    The entries left half written by a crashed process are removed after STALE_TEMP_AGE seconds.
+    """
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key) -> Dict[str, np.ndarray]:
+        path = self._entry_path(key)
+        fields_path = os.path.join(path, FIELDS_FILE)
+        try:
+            with open(fields_path) as f:
+                fields = json.load(f)
+            data = {field: np.load(os.path.join(path, "%s.npy" % i), mmap_mode="r") for i, field in enumerate(fields)}
+        except (OSError, ValueError):
+            return None
+        try:
+            # the modification time of the fields file is the last use of the entry
+            os.utime(fields_path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Saves the arrays of a scan, and returns them as memory maps of the cache."""
+        path = self._entry_path(key)
+        temp_path = tempfile.mkdtemp(prefix=TEMP_PREFIX, dir=self.directory)
+        try:
+            for i, array in enumerate(data.values()):
+                np.save(os.path.join(temp_path, "%s.npy" % i), array)
+            with open(os.path.join(temp_path, FIELDS_FILE), "w") as f:
+                json.dump(list(data), f)
+            # the entry appears at once, another process may have saved it first
+            os.rename(temp_path, path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors=True)
+        self._evict(keep=path)
+        cached = self.get(key)
+        return data if cached is None else cached
+
+    def _evict(self, keep):
+        entries = []
+        total = self._entry_size(keep)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == keep:
+                continue
+            if name.startswith(TEMP_PREFIX):
+                if self._is_stale(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    # entries being written by other processes
+                    total += self._entry_size(path)
+                continue
+            try:
+                used = os.stat(os.path.join(path, FIELDS_FILE)).st_mtime_ns
+            except OSError:
+                continue
+            entries.append((used, self._entry_size(path), path))
+        if self.max_bytes is None:
+            return
+        total += sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    @staticmethod
+    def _is_stale(path):
+        # files are added to a temporary directory while its entry is written
+        try:
+            return time.time() - os.stat(path).st_mtime > STALE_TEMP_AGE
+        except OSError:
+            return False
+
+    @staticmethod
+    def _entry_size(path):
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(path))
+        except OSError:
+            return 0
+
+    @property
+    def size(self):
+        """Number of bytes used by the cache, including the entries being written."""
+        return sum(self._entry_size(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+
+    def clear(self):
+        """Removes all the entries, except the ones other processes are writing."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(TEMP_PREFIX) and not self._is_stale(path):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,150 @@
+from abc import ABC, abstractmethod
+from typing import Dict
+
+import numpy as np
+
+
+class Decimator(ABC):
+    """Keeps a subset of the points of a scan, one chunk at a time.
+
+    `begin` is called before the first chunk of a scan, `filter` returns the points of a chunk
+    that are kept, and `end` returns the points that are only known once all the chunks were seen.
+    All the fields of a chunk are decimated together, so columns stay aligned.
+    """
+    def begin(self, point_count):
+        pass
+
+    @abstractmethod
+    def filter(self, chunk: Dict) -> Dict:
+        pass
+
+    def end(self) -> Dict:
+        return {}
+
+
+def _take(chunk, indices):
+    return {field: array[indices] for field, array in chunk.items()}
+
+
+def _chunk_size(chunk):
+    return next(iter(chunk.values())).shape[0] if chunk else 0
+
+
+class Stride(Decimator):
+    """Keeps one point every `step` points."""
+    def __init__(self, step):
+        if step < 1:
+            raise ValueError("The stride must be a positive integer")
+        self.step = int(step)
+        self._offset = 0
+
+    def begin(self, point_count):
+        self._offset = 0
+
+    def filter(self, chunk):
+        count = _chunk_size(chunk)
+        # index of the first point to keep in this chunk
+        first = -self._offset % self.step
+        self._offset += count
+        # copied, so that the chunk can be released
+        return {field: array[first::self.step].copy() for field, array in chunk.items()}
+
+
+# bits used for the voxel index along each axis, so that the 3 indices fit in a single int64 key
+VOXEL_INDEX_BITS = 21
+
+
+class VoxelGrid(Decimator):
+    """Keeps the first point of each cube of side `size`, using the cartesian coordinates."""
+    def __init__(self, size):
+        if size <= 0:
+            raise ValueError("The voxel size must be positive")
+        self.size = size
+        self._origin = None
+        # sorted arrays of the keys of the voxels seen so far, from the largest to the smallest
+        self._runs = []
+
+    def begin(self, point_count):
+        self._origin = None
+        self._runs = []
+
+    def _seen(self, keys):
+        seen = np.zeros(keys.shape[0], bool)
+        for run in self._runs:
+            positions = np.minimum(np.searchsorted(run, keys), run.shape[0] - 1)
+            seen |= run[positions] == keys
+        return seen
+
+    def _add(self, keys):
+        # like the digits of a binary counter, a run is merged with the previous ones that aren't larger,
+        # so there are O(log(n)) runs and each key is copied O(log(n)) times
+        run = keys
+        while self._runs and self._runs[-1].shape[0] <= run.shape[0]:
+            run = np.sort(np.concatenate([self._runs.pop(), run]), kind="mergesort")
+        self._runs.append(run)
+
+    def filter(self, chunk):
+        if not all(field in chunk for field in ("cartesianX", "cartesianY", "cartesianZ")):
+            raise ValueError("VoxelGrid needs cartesian coordinates, spherical scans must be transformed")
+        count = _chunk_size(chunk)
+        if count == 0:
+            return _take(chunk, np.empty(0, np.intp))
+        voxels = np.empty((3, count), np.int64)
+        for i, field in enumerate(("cartesianX", "cartesianY", "cartesianZ")):
+            np.floor_divide(chunk[field], self.size, out=voxels[i], casting="unsafe")
+        # the voxels are indexed from the first point, so that georeferenced coordinates fit in the keys
+        if self._origin is None:
+            self._origin = voxels[:, :1] - (1 << (VOXEL_INDEX_BITS - 1))
+        voxels -= self._origin
+        if voxels.min() < 0 or voxels.max() >= 1 << VOXEL_INDEX_BITS:
+            raise ValueError("The scan spans too many voxels of size %s" % self.size)
+        keys = (voxels[0] << 2 * VOXEL_INDEX_BITS) | (voxels[1] << VOXEL_INDEX_BITS) | voxels[2]
+        keys, indices = np.unique(keys, return_index=True)
+        new = ~self._seen(keys)
+        if np.any(new):
+            self._add(keys[new])
+        # the points are kept in the order of the scan
+        return _take(chunk, np.sort(indices[new]))
+
+
+class RandomSample(Decimator):
+    """Keeps `count` points chosen uniformly at random, reproducible with `seed`.
+
+    Each point gets a random priority and the points with the lowest priorities are kept,
+    so only `count` points are held in memory. They are returned in the order of the scan.
+    """
+    def __init__(self, count, seed=None):
+        if count < 0:
+            raise ValueError("The number of points to sample can't be negative")
+        self.count = int(count)
+        self.seed = seed
+        self._rng = None
+        self._sample = None
+        self._offset = 0
+
+    def begin(self, point_count):
+        self._rng = np.random.default_rng(self.seed)
+        self._sample = None
+        self._offset = 0
+
+    def filter(self, chunk):
+        count = _chunk_size(chunk)
+        candidates = dict(chunk)
+        candidates["_priority"] = self._rng.random(count)
+        candidates["_index"] = np.arange(self._offset, self._offset + count)
+        self._offset += count
+        if self._sample is not None:
+            candidates = {field: np.concatenate([self._sample[field], array]) for field, array in candidates.items()}
+        if _chunk_size(candidates) > self.count:
+            kept = np.argpartition(candidates["_priority"], self.count)[:self.count]
+            candidates = _take(candidates, kept)
+        self._sample = candidates
+        return _take(chunk, np.empty(0, np.intp))
+
+    def end(self):
+        if self._sample is None:
+            return {}
+        order = np.argsort(self._sample.pop("_index"))
+        del self._sample["_priority"]
+        sample, self._sample = _take(self._sample, order), None
+        return sample
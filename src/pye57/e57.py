@@ -1,6 +1,11 @@
 import uuid
 import os
-from typing import Dict
+import traceback
+import weakref
+from itertools import chain
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List
 from enum import Enum
 
 import numpy as np
@@ -9,7 +14,11 @@ from pyquaternion import Quaternion
 from pye57.__version__ import __version__
 from pye57 import libe57
 from pye57 import ScanHeader
-from pye57.utils import convert_spherical_to_cartesian
+from pye57.image_header import ImageHeader
+from pye57.arrow import import_pyarrow, record_batch, scan_schema
+from pye57.decimation import Decimator
+from pye57.file_index import read_cached_chunk_bounds, save_chunk_bounds
+from pye57.utils import field_dtype, filter_and_transform, transformed_dtype
 
 try:
     from exceptions import WindowsError
@@ -47,14 +56,58 @@ SUPPORTED_POINT_FIELDS = {
     "sphericalInvalidState": "b",
 }
 
+DEFAULT_CHUNK_SIZE = 1000000
+# number of bytes of an image blob read at once
+DEFAULT_BLOB_CHUNK_SIZE = 1 << 20
+# number of records summarized by each bounding box of the chunk index used by E57.query
+DEFAULT_QUERY_CHUNK_SIZE = 65536
+
+# how the types of the point arrays are chosen when reading:
+# 'float64' uses the types of SUPPORTED_POINT_FIELDS (coordinates in float64) unless they would lose data,
+# 'native' keeps the precision of the file (e.g. float32 for single precision coordinates),
+# except for coordinates transformed by the pose of a scan, which are float64,
+# 'raw' is 'native' with scaled integers left unscaled (see E57.point_scaling)
+DTYPE_POLICIES = ("float64", "native", "raw")
+
+CHECKSUM_POLICIES = {
+    "none": libe57.CHECKSUM_POLICY_NONE,
+    "sparse": libe57.CHECKSUM_POLICY_SPARSE,
+    "half": libe57.CHECKSUM_POLICY_HALF,
+    "all": libe57.CHECKSUM_POLICY_ALL,
+}
+
 
 class E57:
-    def __init__(self, path, mode="r"):
+    def __init__(self, path, mode="r", checksum_policy=libe57.CHECKSUM_POLICY_ALL, cache=None):
+        """Opens an E57 file.
+
+        `checksum_policy` is the fraction of pages whose checksum is verified when reading,
+        either one of the libe57.CHECKSUM_POLICY_* constants (a percentage)
+        or one of 'none', 'sparse', 'half' and 'all'.
+        Skipping the verification is faster for files that are already known to be valid.
+
+        `cache` keeps the points returned by `read_scan` and `read_scan_raw` to return them again
+        without decoding the scan, either a `pye57.ScanCache` (in memory) or a `pye57.DiskScanCache`.
+        The cached arrays are read-only.
+        """
         if mode not in "rw":
             raise ValueError("Only 'r' and 'w' modes are supported")
+        if isinstance(checksum_policy, str):
+            if checksum_policy.lower() not in CHECKSUM_POLICIES:
+                raise ValueError("Unknown checksum policy: %s" % checksum_policy)
+            checksum_policy = CHECKSUM_POLICIES[checksum_policy.lower()]
+        if not 0 <= checksum_policy <= 100:
+            raise ValueError("The checksum policy must be between 0 and 100")
         self.path = path
+        self.checksum_policy = checksum_policy
+        self.cache = cache
+        self._headers = {}
+        self._image_headers = {}
+        self._range_readers = {}
+        # bounds of the chunks of the scans, by scan index and chunk size
+        self._chunk_bounds = {}
         try:
-            self.image_file = libe57.ImageFile(path, mode)
+            self.image_file = libe57.ImageFile(path, mode, checksum_policy)
             if mode == "w":
                 self.write_default_header()
         except Exception as e:
@@ -75,6 +128,9 @@ class E57:
         self.close()
 
     def close(self):
+        for range_reader in getattr(self, "_range_readers", {}).values():
+            range_reader.close()
+        self._range_readers = {}
         if hasattr(self, "image_file"):
             self.image_file.close()
 
@@ -91,7 +147,69 @@ class E57:
         return len(self.data3d)
 
     def get_header(self, index):
-        return ScanHeader(self.data3d[index])
+        # headers memoize the values they read, so they are cached for each scan
+        if index not in self._headers:
+            self._headers[index] = ScanHeader(self.data3d[index])
+        return self._headers[index]
+
+    def get_headers(self):
+        return [self.get_header(index) for index in range(self.scan_count)]
+
+    @property
+    def images2d(self):
+        return self.root["images2D"]
+
+    @property
+    def image_count(self):
+        return len(self.images2d) if self.root.isDefined("images2D") else 0
+
+    def get_image_header(self, index):
+        if index not in self._image_headers:
+            self._image_headers[index] = ImageHeader(self.images2d[index])
+        return self._image_headers[index]
+
+    def read_image(self, index, out=None, *, mask=False, chunk_size=DEFAULT_BLOB_CHUNK_SIZE) -> memoryview:
+        """Reads the encoded (jpeg or png) bytes of an image, or of its mask with `mask=True`.
+
+        The blob is read directly into `out`, any writable buffer of at least `byte_count` bytes
+        (a bytearray, a uint8 numpy array, an mmap, ...), in reads of `chunk_size` bytes.
+        By default, a new bytearray is allocated. Returns a memoryview of the bytes of the image.
+        """
+        header = self.get_image_header(index)
+        blob = header.mask_blob if mask else header.blob
+        byte_count = blob.byteCount()
+        if out is None:
+            out = bytearray(byte_count)
+        view = memoryview(out).cast("B")
+        if view.readonly or view.nbytes < byte_count:
+            raise ValueError("'out' must be a writable buffer of at least %s bytes" % byte_count)
+        view = view[:byte_count]
+        for start in range(0, byte_count, chunk_size):
+            count = min(chunk_size, byte_count - start)
+            blob.read(view[start:start + count], start, count)
+        return view
+
+    def iter_image_chunks(self, index, *, mask=False, chunk_size=DEFAULT_BLOB_CHUNK_SIZE) -> Iterator[memoryview]:
+        """Reads the encoded bytes of an image in chunks of at most `chunk_size` bytes.
+
+        The same buffer is reused for every chunk, so each memoryview is only valid until
+        the next one is yielded. Useful to copy an image to a file without holding it in memory.
+        """
+        header = self.get_image_header(index)
+        blob = header.mask_blob if mask else header.blob
+        byte_count = blob.byteCount()
+        buffer = memoryview(bytearray(min(chunk_size, byte_count)))
+        for start in range(0, byte_count, chunk_size):
+            count = min(chunk_size, byte_count - start)
+            blob.read(buffer, start, count)
+            yield buffer[:count]
+
+    def iter_images(self, indices=None) -> Iterator[tuple]:
+        """Yields the header and the encoded bytes of each image, reading one image at a time."""
+        if indices is None:
+            indices = range(self.image_count)
+        for index in indices:
+            yield self.get_image_header(index), self.read_image(index)
 
     def write_default_header(self):
         imf = self.image_file
@@ -109,57 +227,269 @@ class E57:
         self.root.set("data3D", libe57.VectorNode(imf, True))
         self.root.set("images2D", libe57.VectorNode(imf, True))
 
-    def make_buffer(self, field_name, capacity, do_conversion=True, do_scaling=True):
-        # now this exception should never get hit through read_scan or read_scan_raw
-        # for read_scan, the headers are constructed, so they should all be supported
-        # for read_scan_raw, it now filters out the unsupported headers
-        # however, if make_buffer or make_buffers gets called, an unsupported field name could be passed in directly
-        # if we don't want users calling them, maybe we could make them private, and this would be an assertion
-        if field_name not in SUPPORTED_POINT_FIELDS:
-            raise ValueError("Unsupported point field: %s" % field_name)
-
-        np_array = np.empty(capacity, SUPPORTED_POINT_FIELDS[field_name])
+    def make_buffer(self, field_name, capacity, do_conversion=True, do_scaling=True, out=None, dtype=None):
+        # fields that are not in SUPPORTED_POINT_FIELDS need a 'dtype' (see point_dtypes) or an 'out' array
+        if out is None:
+            if dtype is None:
+                if field_name not in SUPPORTED_POINT_FIELDS:
+                    raise ValueError("Unsupported point field: %s" % field_name)
+                dtype = SUPPORTED_POINT_FIELDS[field_name]
+            np_array = np.empty(capacity, dtype)
+        else:
+            # 'out' can be a strided view, e.g. a column of a 2d array or a field of a structured array
+            if out.ndim != 1 or out.shape[0] < capacity or out.strides[0] <= 0:
+                raise ValueError("The output array for %s must be a 1d array "
+                                 "with at least %s elements" % (field_name, capacity))
+            np_array = out
         buffer = libe57.SourceDestBuffer(self.image_file,
                                          field_name,
                                          np_array,
                                          capacity,
                                          do_conversion,
-                                         do_scaling)
+                                         do_scaling,
+                                         np_array.strides[0])
         return np_array, buffer
 
-    def make_buffers(self, field_names, capacity, do_conversion=True, do_scaling=True):
+    def make_buffers(self, field_names, capacity, do_conversion=True, do_scaling=True, out=None, dtypes=None):
+        """Creates one SourceDestBuffer per field.
+
+        By default, a new array is allocated for each field, with the type given in `dtypes`
+        (a dictionary, see `point_dtypes`) or in SUPPORTED_POINT_FIELDS. `out` can be given to decode
+        into existing memory instead: either a 2d array with one column per field,
+        a structured array with one named field per point field, or a dictionary of 1d arrays
+        (arrays are allocated for the fields that are absent from it).
+        """
         data = {}
         buffers = libe57.VectorSourceDestBuffer()
-        for field in field_names:
-            d, b = self.make_buffer(field, capacity, do_conversion=do_conversion, do_scaling=do_scaling)
+        for i, field in enumerate(field_names):
+            field_out = None
+            if isinstance(out, dict):
+                field_out = out.get(field)
+            elif out is not None:
+                field_out = out[field] if out.dtype.names else out[:, i]
+            dtype = None if dtypes is None else dtypes.get(field)
+            d, b = self.make_buffer(field, capacity, do_conversion=do_conversion, do_scaling=do_scaling,
+                                    out=field_out, dtype=dtype)
             data[field] = d
             buffers.append(b)
         return data, buffers
 
-    def read_scan_raw(self, index, ignore_unsupported_fields=False) -> Dict:
+    def point_dtypes(self, index, fields=None, dtype_policy="float64") -> Dict[str, np.dtype]:
+        """Returns the numpy type used to read each point field of a scan.
+
+        The types are derived from the prototype of the scan: the narrowest type that holds
+        the values of a field without loss. With the 'float64' policy, the type in SUPPORTED_POINT_FIELDS
+        is used instead if it's large enough (see DTYPE_POLICIES).
+        By default, all the point fields are returned. Fields that can't be read (strings) are skipped.
+        """
+        if dtype_policy not in DTYPE_POLICIES:
+            raise ValueError("Unknown dtype policy: %s" % dtype_policy)
+        header = self.get_header(index)
+        if fields is None:
+            fields = header.point_fields
+        dtypes = {}
+        for field in fields:
+            if field not in header.point_fields:
+                raise ValueError("Point field %s is absent from scan %s" % (field, index))
+            try:
+                preferred = SUPPORTED_POINT_FIELDS.get(field) if dtype_policy == "float64" else None
+                dtypes[field] = field_dtype(header.prototype.get(field), preferred, scaled=dtype_policy != "raw")
+            except ValueError:
+                pass
+        return dtypes
+
+    def point_scaling(self, index) -> Dict[str, tuple]:
+        """Returns the (scale, offset) of the scaled integer point fields of a scan.
+
+        Values read with the 'raw' dtype policy are scaled with `raw * scale + offset`.
+        """
         header = self.get_header(index)
-        supported_point_fields = []
-        unsupported_point_fields = []
+        scaling = {}
         for field in header.point_fields:
-            if field in SUPPORTED_POINT_FIELDS:
-                supported_point_fields.append(field)
-            else:
-                unsupported_point_fields.append(field)
+            node = header.prototype.get(field)
+            if node.type() == libe57.NodeType.E57_SCALED_INTEGER:
+                node = libe57.ScaledIntegerNode(node)
+                scaling[field] = (node.scale(), node.offset())
+        return scaling
+
+    def read_scan_raw(self, index, ignore_unsupported_fields=False, *, fields=None, dtype_policy="float64") -> Dict:
+        """Reads the point fields of a scan as they are stored, without filtering or transformation.
+
+        Any numeric point field can be read, see `point_dtypes` for the type of each field
+        and DTYPE_POLICIES for `dtype_policy`. `fields` selects the fields to decode,
+        by default all of them are read.
+        """
+        key = self._cache_key(index,
+                              "read_scan_raw",
+                              ignore_unsupported_fields=ignore_unsupported_fields,
+                              fields=fields,
+                              dtype_policy=dtype_policy)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        header = self.get_header(index)
+        dtypes = self.point_dtypes(index, fields, dtype_policy)
+        unsupported_point_fields = [field for field in fields or header.point_fields if field not in dtypes]
         if unsupported_point_fields != [] and not ignore_unsupported_fields:
             raise ValueError("Unsupported point fields: %s.\n"
                             "Consider using 'ignore_unsupported_fields' to skip them." % unsupported_point_fields)
-        # could it call make_buffers instead, it looks like the code's identical
-        data = {}
-        buffers = libe57.VectorSourceDestBuffer()
-        for field in supported_point_fields:
-            np_array, buffer = self.make_buffer(field, header.point_count)
-            data[field] = np_array
-            buffers.append(buffer)
-
-        header.points.reader(buffers).read()
-
+        data, buffers = self.make_buffers(list(dtypes), header.point_count, do_scaling=dtype_policy != "raw",
+                                          dtypes=dtypes)
+        # libE57Format can't open a reader on a scan without records
+        if buffers and header.point_count > 0:
+            header.points.reader(buffers).read()
+
+        return data if key is None else self.cache.put(key, data)
+
+    def _cache_key(self, index, method, **options):
+        # identifies the points returned by a method, None if they can't be cached
+        if self.cache is None or self.image_file.isWritable() or not isinstance(self.path, (str, os.PathLike)):
+            return None
+        try:
+            guid = self.get_header(index).guid
+        except libe57.E57Exception:
+            # without a guid, the scans of a file rewritten in place can't be told apart
+            return None
+        stat = os.stat(self.path)
+        options = tuple((name, tuple(value) if isinstance(value, (list, tuple)) else value)
+                        for name, value in sorted(options.items()))
+        return os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns, guid, index, method, options
+
+    def read_scan_range(self, index, start, stop, *, fields=None, chunk_size=DEFAULT_CHUNK_SIZE) -> Dict:
+        """Reads the raw point fields of the records `start` to `stop` (excluded) of a scan.
+
+        The reader of the scan is kept open between calls, so reading consecutive windows
+        only decodes each record once. Reading a window located before the previous one
+        starts decoding from the beginning of the scan again.
+        By default, all the point fields of the scan that can be read are read.
+        """
+        header = self.get_header(index)
+        stop = min(stop, header.point_count)
+        if start < 0 or start > stop:
+            raise ValueError("Invalid range of records: %s to %s" % (start, stop))
+        dtypes = self.point_dtypes(index, fields)
+        fields = list(dtypes)
+
+        range_reader = self._range_readers.get(index)
+        if range_reader is None or range_reader.fields != fields or start < range_reader.chunk_start:
+            if range_reader is not None:
+                range_reader.close()
+            capacity = max(1, min(chunk_size, header.point_count))
+            range_reader = _RangeReader(self, header, dtypes, capacity)
+            self._range_readers[index] = range_reader
+
+        data = {field: np.empty(stop - start, dtype) for field, dtype in dtypes.items()}
+        range_reader.read(start, stop, data)
         return data
 
+    def chunk_bounds(self, index, chunk_size=DEFAULT_QUERY_CHUNK_SIZE) -> np.ndarray:
+        """Computes the bounds of the valid points of each chunk of `chunk_size` records of a scan.
+
+        Returns a (n_chunks, 6) array of x, y, z minimums and maximums, in the coordinate system
+        of the scan (before its pose), with NaN for the chunks without valid points.
+        The bounds are computed once for each scan and chunk size, the array is read-only.
+        """
+        if (index, chunk_size) not in self._chunk_bounds:
+            header = self.get_header(index)
+            coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+            fields, valid_state = self._scan_fields(header, coordinate_system, ignore_missing_fields=True)
+            bounds = [_local_bounds(chunk, coordinate_system, valid_state)
+                      for chunk in self._read_chunks(header, self.point_dtypes(index, fields), chunk_size)]
+            self._set_chunk_bounds(index, chunk_size, bounds)
+        return self._chunk_bounds[(index, chunk_size)]
+
+    def _set_chunk_bounds(self, index, chunk_size, bounds):
+        bounds = np.array(bounds, dtype=float).reshape(-1, 6)
+        bounds.flags.writeable = False
+        self._chunk_bounds[(index, chunk_size)] = bounds
+
+    def query(self,
+              bbox,
+              scans=None,
+              *,
+              intensity=False,
+              colors=False,
+              row_column=False,
+              fields=None,
+              ignore_missing_fields=False,
+              chunk_size=DEFAULT_QUERY_CHUNK_SIZE,
+              cache=False) -> Dict[int, Dict]:
+        """Reads the valid points that are inside a box, from some scans (by default, all of them).
+
+        `bbox` is ((x_min, y_min, z_min), (x_max, y_max, z_max)), in the global coordinate system.
+        Returns a dictionary with the points of each scan that has points in the box, like `read_scan`.
+
+        Scans whose `cartesianBounds` don't intersect the box are skipped. Within a scan, the bounds of
+        each chunk of `chunk_size` records (see `chunk_bounds`) are used to read only the chunks that
+        intersect the box. They are computed while the first query of a scan decodes it, and kept
+        for the next queries. With `cache=True`, they are also saved next to the file
+        (see `file_index.save_chunk_bounds`), to be reused when the file is opened again.
+        Decoding stops after the last chunk that intersects the box. The chunks before it are skipped
+        with a seek when the underlying libE57Format supports it, otherwise they are decoded and discarded.
+        """
+        bbox = np.asarray(bbox, dtype=float)
+        if bbox.shape != (2, 3) or np.any(bbox[0] > bbox[1]):
+            raise ValueError("The box must be given as (x, y, z) minimums and (x, y, z) maximums")
+        if scans is None:
+            scans = range(self.scan_count)
+        candidates = [index for index in scans if self._scan_may_intersect(index, bbox)]
+        cache = cache and isinstance(self.path, (str, os.PathLike)) and not self.image_file.isWritable()
+        saved = read_cached_chunk_bounds(self, chunk_size, cache) if cache else {}
+        for index, bounds in saved.items():
+            if (index, chunk_size) not in self._chunk_bounds:
+                self._set_chunk_bounds(index, chunk_size, bounds)
+
+        results = {}
+        for index in candidates:
+            header = self.get_header(index)
+            coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+            scan_fields, valid_state = self._scan_fields(header,
+                                                         coordinate_system,
+                                                         intensity=intensity,
+                                                         colors=colors,
+                                                         row_column=row_column,
+                                                         fields=fields,
+                                                         ignore_missing_fields=ignore_missing_fields)
+            pieces = []
+            if (index, chunk_size) not in self._chunk_bounds:
+                # the scan is decoded once, computing the bounds of its chunks along the way
+                bounds = []
+                for chunk in self._read_chunks(header, self.point_dtypes(index, scan_fields), chunk_size):
+                    bounds.append(_local_bounds(chunk, coordinate_system, valid_state))
+                    data = self._finish_points(dict(chunk), header, coordinate_system, valid_state,
+                                               transform=True, copy=True)
+                    pieces.append(_points_in_box(data, bbox))
+                self._set_chunk_bounds(index, chunk_size, bounds)
+            else:
+                bounds = self._chunk_bounds[(index, chunk_size)]
+                local_bbox = _box_to_local(bbox, header)
+                hits = np.all(bounds[:, :3] <= local_bbox[1], axis=1) & np.all(bounds[:, 3:] >= local_bbox[0], axis=1)
+                for start, stop in _record_ranges(hits, chunk_size, header.point_count):
+                    data = self.read_scan_range(index, start, stop, fields=scan_fields, chunk_size=chunk_size)
+                    data = self._finish_points(data, header, coordinate_system, valid_state, transform=True)
+                    pieces.append(_points_in_box(data, bbox))
+                if index in self._range_readers:
+                    self._range_readers.pop(index).close()
+            if pieces and any(piece["cartesianX"].shape[0] for piece in pieces):
+                results[index] = {field: np.concatenate([piece[field] for piece in pieces]) for field in pieces[0]}
+        unsaved = {index: self._chunk_bounds[(index, chunk_size)] for index in candidates if index not in saved}
+        if cache and unsaved:
+            save_chunk_bounds(self, chunk_size, unsaved, cache)
+        return results
+
+    def _scan_may_intersect(self, index, bbox):
+        header = self.get_header(index)
+        if not header.node.isDefined("cartesianBounds"):
+            return True
+        scan_bbox = np.array([[header.xMinimum, header.yMinimum, header.zMinimum],
+                              [header.xMaximum, header.yMaximum, header.zMaximum]])
+        # rotated bounds can end up with their minimums and maximums swapped
+        scan_bbox = np.array([scan_bbox.min(axis=0), scan_bbox.max(axis=0)])
+        # the bounds should be in the coordinate system of the scan, but some writers
+        # (including write_scan_raw) store them in the global coordinate system, so both are checked
+        return _boxes_intersect(scan_bbox, _box_to_local(bbox, header)) or _boxes_intersect(scan_bbox, bbox)
+
     def scan_position(self, index):
         pt = np.array([[0, 0, 0]])
         header = self.get_header(index)
@@ -170,269 +500,1115 @@ class E57:
         rotation_matrix = Quaternion(rotation).rotation_matrix
         return (np.dot(rotation_matrix, points.T) + translation.reshape(3, 1)).T
 
+    def _scan_fields(self,
+                     header,
+                     coordinate_system,
+                     *,
+                     intensity=False,
+                     colors=False,
+                     row_column=False,
+                     fields=None,
+                     ignore_missing_fields=False):
+        if coordinate_system is COORDINATE_SYSTEMS.CARTESIAN:
+            valid_state = "cartesianInvalidState"
+        elif coordinate_system is COORDINATE_SYSTEMS.SPHERICAL:
+            valid_state = "sphericalInvalidState"
+        selected = list(coordinate_system.value.keys())
+        if intensity:
+            selected.append("intensity")
+        if colors:
+            selected.append("colorRed")
+            selected.append("colorGreen")
+            selected.append("colorBlue")
+        if row_column:
+            selected.append("rowIndex")
+            selected.append("columnIndex")
+        for field in fields or []:
+            if field not in selected and field != valid_state:
+                selected.append(field)
+        selected.append(valid_state)
+
+        for field in selected[:]:
+            if field not in header.point_fields:
+                if ignore_missing_fields:
+                    selected.remove(field)
+                else:
+                    raise ValueError("Requested to read a field (%s) with is absent from the e57 file. "
+                                     "Consider using 'ignore_missing_fields' to skip it." % field)
+        return selected, valid_state
+
+    def _finish_points(self, data, header, coordinate_system, valid_state, transform, copy=False, out=None):
+        # filters the invalid points and transforms the coordinates in a single pass,
+        # 'copy' is set when the arrays of 'data' must not be returned as is,
+        # 'out' maps each field of the result to an array to write it to
+        valid = None
+        if valid_state in data:
+            valid = data.pop(valid_state) == 0
+        if valid is None and not transform and out is None:
+            return {field: array.copy() for field, array in data.items()} if copy else data
+
+        spherical = transform and coordinate_system is COORDINATE_SYSTEMS.SPHERICAL
+        coordinate_fields = list(coordinate_system.value)
+        # spherical coordinates are kept along with the cartesian ones
+        other_fields = [field for field in data if spherical or field not in coordinate_fields]
+        if out is not None:
+            result_fields = list(SUPPORTED_CARTESIAN_POINT_FIELDS) if spherical else coordinate_fields
+            out = [out[field] for field in result_fields + other_fields]
+        elif valid is None and not copy:
+            out = [None if spherical else data[field] for field in coordinate_fields]
+            out += [data[field] for field in other_fields]
+        rotation_matrix = translation = None
+        if transform and header.has_pose():
+            rotation_matrix, translation = header.rotation_matrix, header.translation
+        coordinates, others = filter_and_transform([data[field] for field in coordinate_fields],
+                                                   [data[field] for field in other_fields],
+                                                   valid,
+                                                   spherical=spherical,
+                                                   rotation_matrix=rotation_matrix,
+                                                   translation=translation,
+                                                   out=out)
+        data.update(zip(other_fields, others))
+        data.update(zip(SUPPORTED_CARTESIAN_POINT_FIELDS if spherical else coordinate_fields, coordinates))
+        return data
+
     def read_scan(self,
                   index,
                   *,
                   intensity=False,
                   colors=False,
                   row_column=False,
+                  fields=None,
                   transform=True,
-                  ignore_missing_fields=False) -> Dict:
+                  ignore_missing_fields=False,
+                  dtype_policy="float64",
+                  decimate: Decimator = None) -> Dict:
+        """Reads the valid points of a scan, in the coordinate system of the file by default.
+
+        `fields` lists extra point fields to read on top of the coordinates, e.g. 'nor:normalX'.
+        With the 'native' `dtype_policy`, single precision coordinates are returned as float32,
+        which halves the memory used, unless the scan has a pose and `transform` is set. See DTYPE_POLICIES.
+        `decimate` keeps a subset of the points (see pye57.decimation). The scan is then decoded
+        in chunks, and the points of each chunk are decimated before the next one is decoded.
+        """
+        _check_transform(dtype_policy, transform)
         header = self.get_header(index)
         n_points = header.point_count
-
+        if decimate is not None and n_points > 0:
+            chunks = self.iter_scan(index,
+                                    intensity=intensity,
+                                    colors=colors,
+                                    row_column=row_column,
+                                    fields=fields,
+                                    transform=transform,
+                                    ignore_missing_fields=ignore_missing_fields,
+                                    dtype_policy=dtype_policy)
+            return _decimate(chunks, decimate, n_points)
+
+        key = self._cache_key(index,
+                              "read_scan",
+                              intensity=intensity,
+                              colors=colors,
+                              row_column=row_column,
+                              fields=fields,
+                              transform=transform,
+                              ignore_missing_fields=ignore_missing_fields,
+                              dtype_policy=dtype_policy)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        data = self._read_scan_into(index,
+                                    None,
+                                    intensity=intensity,
+                                    colors=colors,
+                                    row_column=row_column,
+                                    fields=fields,
+                                    transform=transform,
+                                    ignore_missing_fields=ignore_missing_fields,
+                                    dtype_policy=dtype_policy)
+        return data if key is None else self.cache.put(key, data)
+
+    def _read_scan_into(self,
+                        index,
+                        out,
+                        *,
+                        intensity=False,
+                        colors=False,
+                        row_column=False,
+                        fields=None,
+                        transform=True,
+                        ignore_missing_fields=False,
+                        dtype_policy="float64") -> Dict:
+        # reads the points of read_scan, 'out' maps each field of the result to an array of
+        # at least point_count elements to write it to. The fields are decoded directly into
+        # the arrays that have their type, and the valid points are compacted at their beginning.
+        header = self.get_header(index)
         coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
-        if coordinate_system is COORDINATE_SYSTEMS.CARTESIAN:
-            validState = "cartesianInvalidState"
-            fields = list(SUPPORTED_CARTESIAN_POINT_FIELDS.keys())
-        elif coordinate_system is COORDINATE_SYSTEMS.SPHERICAL: 
-            validState = "sphericalInvalidState"
-            fields = list(SUPPORTED_SPHERICAL_POINT_FIELDS.keys())
-        if intensity:
-            fields.append("intensity")
-        if colors:
-            fields.append("colorRed")
-            fields.append("colorGreen")
-            fields.append("colorBlue")
-        if row_column:
-            fields.append("rowIndex")
-            fields.append("columnIndex")
-        fields.append(validState)
+        fields, valid_state = self._scan_fields(header,
+                                                coordinate_system,
+                                                intensity=intensity,
+                                                colors=colors,
+                                                row_column=row_column,
+                                                fields=fields,
+                                                ignore_missing_fields=ignore_missing_fields)
+
+        dtypes = self.point_dtypes(index, fields, dtype_policy)
+        decode_out = None
+        if out is not None:
+            decode_out = {field: array for field, array in out.items() if dtypes.get(field) == array.dtype}
+        data, buffers = self.make_buffers(fields,
+                                          header.point_count,
+                                          do_scaling=dtype_policy != "raw",
+                                          out=decode_out,
+                                          dtypes=dtypes)
+        header.points.reader(buffers).read()
+        return self._finish_points(data, header, coordinate_system, valid_state, transform, out=out)
 
-        for field in fields[:]:
-            if field not in header.point_fields:
-                if ignore_missing_fields:
-                    fields.remove(field)
-                else:
-                    raise ValueError("Requested to read a field (%s) with is absent from the e57 file. "
-                                     "Consider using 'ignore_missing_fields' to skip it." % field)
+    def read_scan_xyz(self, index, *, out=None, transform=True) -> np.ndarray:
+        """Reads the coordinates of a scan into a single (N, 3) float64 array.
 
-        data, buffers = self.make_buffers(fields, n_points)
+        The coordinates are decoded directly into the columns of `out`, without stacking
+        separate arrays. `out` can be given to reuse memory across scans: it must have 3
+        columns and at least `point_count` rows. Invalid points are removed, and the
+        returned array is a view of the first rows of `out`.
+        With `transform=False`, spherical scans are returned as range, azimuth, elevation.
+        """
+        header = self.get_header(index)
+        n_points = header.point_count
+        coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+        fields, valid_state = self._scan_fields(header, coordinate_system, ignore_missing_fields=True)
+
+        if out is None:
+            out = np.empty((n_points, 3), "d")
+        elif out.dtype != np.float64 or out.ndim != 2 or out.shape[1] != 3 or out.shape[0] < n_points:
+            raise ValueError("'out' must be a float64 array of shape (n, 3) with n >= %s" % n_points)
+        xyz = out[:n_points]
+
+        _, buffers = self.make_buffers(list(coordinate_system.value), n_points, out=xyz)
+        if valid_state in fields:
+            state, buffer = self.make_buffer(valid_state, n_points,
+                                             dtype=self.point_dtypes(index, [valid_state])[valid_state])
+            buffers.append(buffer)
         header.points.reader(buffers).read()
 
-        if validState in data:
-            valid = ~data[validState].astype("?")
-
-            for field in data:
-                data[field] = data[field][valid]
-
-            del data[validState]
-
-        if transform:
-            if coordinate_system is COORDINATE_SYSTEMS.CARTESIAN:
-                xyz = np.array([data["cartesianX"], data["cartesianY"], data["cartesianZ"]]).T
-            elif coordinate_system is COORDINATE_SYSTEMS.SPHERICAL:
-                rae = np.array([data["sphericalRange"], data["sphericalAzimuth"], data["sphericalElevation"]]).T
-                # rae to xyz
-                xyz = convert_spherical_to_cartesian(rae)
-            # translation to global coordinates
-            if header.has_pose():
-                xyz = self.to_global(xyz, header.rotation, header.translation)
-            data["cartesianX"] = xyz[:, 0]
-            data["cartesianY"] = xyz[:, 1]
-            data["cartesianZ"] = xyz[:, 2]
-        return data
+        valid = state == 0 if valid_state in fields else None
+        spherical = transform and coordinate_system is COORDINATE_SYSTEMS.SPHERICAL
+        rotation_matrix = translation = None
+        if transform and header.has_pose():
+            rotation_matrix, translation = header.rotation_matrix, header.translation
+        # the valid points are compacted at the beginning of 'xyz'
+        columns = [xyz[:, i] for i in range(3)]
+        coordinates, _ = filter_and_transform(columns,
+                                              valid=valid,
+                                              spherical=spherical,
+                                              rotation_matrix=rotation_matrix,
+                                              translation=translation,
+                                              out=columns)
+        return xyz[:coordinates[0].shape[0]]
+
+    def read_scan_grid(self,
+                       index,
+                       *,
+                       intensity=False,
+                       colors=False,
+                       fields=None,
+                       transform=True,
+                       ignore_missing_fields=False,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+        """Reads a gridded scan into dense (rows, columns) arrays, using the rowIndex and columnIndex fields.
+
+        The size of the grid comes from the indexBounds of the scan. The points are scattered in the
+        grid one chunk at a time, as they are decoded. Returns a dictionary with one 2d array per field
+        (as in `read_scan`), and a boolean 2d array that is True where the grid has a valid point.
+        The cells without a valid point are NaN for floating point fields and 0 for the others.
+        """
+        header = self.get_header(index)
+        if not header.node.isDefined("indexBounds"):
+            raise ValueError("Scan %s has no indexBounds, it isn't a gridded scan" % index)
+        if "rowIndex" not in header.point_fields or "columnIndex" not in header.point_fields:
+            raise ValueError("Scan %s has no rowIndex and columnIndex fields" % index)
+        row_minimum, column_minimum = header.rowMinimum, header.columnMinimum
+        shape = (header.rowMaximum - row_minimum + 1, header.columnMaximum - column_minimum + 1)
 
-    def write_scan_raw(self, data: Dict, *, name=None, rotation=None, translation=None, scan_header=None):
+        coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+        scan_fields, valid_state = self._scan_fields(header,
+                                                     coordinate_system,
+                                                     intensity=intensity,
+                                                     colors=colors,
+                                                     row_column=True,
+                                                     fields=fields,
+                                                     ignore_missing_fields=ignore_missing_fields)
+        dtypes = self.point_dtypes(index, scan_fields)
+        output_fields = [field for field in scan_fields if field not in ("rowIndex", "columnIndex", valid_state)]
+        if transform and coordinate_system is COORDINATE_SYSTEMS.SPHERICAL:
+            output_fields += list(SUPPORTED_CARTESIAN_POINT_FIELDS)
+        grid = {}
+        for field in output_fields:
+            dtype = dtypes.get(field, np.dtype("d"))
+            grid[field] = np.full(shape, np.nan if dtype.kind == "f" else 0, dtype)
+        valid = np.zeros(shape, bool)
+
+        for chunk in self._read_chunks(header, dtypes, chunk_size):
+            points = self._finish_points(chunk, header, coordinate_system, valid_state, transform)
+            rows = points["rowIndex"] - row_minimum
+            columns = points["columnIndex"] - column_minimum
+            if rows.size and (rows.min() < 0 or rows.max() >= shape[0]
+                              or columns.min() < 0 or columns.max() >= shape[1]):
+                raise ValueError("Scan %s has points outside of its indexBounds" % index)
+            for field, array in grid.items():
+                array[rows, columns] = points[field]
+            valid[rows, columns] = True
+        return grid, valid
+
+    def read_all(self,
+                 indices=None,
+                 *,
+                 intensity=False,
+                 colors=False,
+                 row_column=False,
+                 fields=None,
+                 transform=True,
+                 ignore_missing_fields=False) -> Dict:
+        """Reads the valid points of several scans (by default, all of them) as a single point cloud.
+
+        The arrays are allocated once for the points of all the scans, and each scan is decoded
+        straight into its slice of the arrays, so the scans are never held separately.
+        The 'scan_index' array gives the index of the scan of each point, in the smallest unsigned type.
+        With `ignore_missing_fields`, only the fields present in all the scans are returned.
+        Spherical scans are returned with cartesian coordinates only, unless `transform` is False.
+        """
+        if indices is None:
+            indices = range(self.scan_count)
+        indices = list(indices)
+        scans = []
+        for index in indices:
+            header = self.get_header(index)
+            coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+            scan_fields, valid_state = self._scan_fields(header,
+                                                         coordinate_system,
+                                                         intensity=intensity,
+                                                         colors=colors,
+                                                         row_column=row_column,
+                                                         fields=fields,
+                                                         ignore_missing_fields=ignore_missing_fields)
+            spherical = coordinate_system is COORDINATE_SYSTEMS.SPHERICAL
+            output = SUPPORTED_CARTESIAN_POINT_FIELDS if transform and spherical else coordinate_system.value
+            scans.append((index, header, coordinate_system, list(output), scan_fields, valid_state))
+
+        coordinate_fields = scans[0][3] if scans else list(SUPPORTED_CARTESIAN_POINT_FIELDS)
+        if any(scan[3] != coordinate_fields for scan in scans):
+            raise ValueError("Scans with cartesian and spherical coordinates can only be merged with transform=True")
+        other_fields = [field for field in (scans[0][4] if scans else [])
+                        if field not in scans[0][2].value and field != scans[0][5]
+                        and all(field in scan[4] for scan in scans)]
+        dtypes = {field: np.dtype("d") for field in coordinate_fields}
+        for field in other_fields:
+            dtypes[field] = np.result_type(*[self.point_dtypes(scan[0], [field])[field] for scan in scans])
+
+        total = sum(scan[1].point_count for scan in scans)
+        data = {field: np.empty(total, dtype) for field, dtype in dtypes.items()}
+        data["scan_index"] = np.empty(total, np.min_scalar_type(max(indices, default=0)))
+        position = 0
+        for index, header, coordinate_system, _, scan_fields, valid_state in scans:
+            n_points = header.point_count
+            if n_points == 0:
+                continue
+            columns = [data[field][position:position + n_points] for field in coordinate_fields]
+            others = [data[field][position:position + n_points] for field in other_fields]
+            buffers = libe57.VectorSourceDestBuffer()
+            for field, out in zip(list(coordinate_system.value) + other_fields, columns + others):
+                buffers.append(self.make_buffer(field, n_points, out=out)[1])
+            valid = None
+            if valid_state in scan_fields:
+                state, buffer = self.make_buffer(valid_state, n_points,
+                                                 dtype=self.point_dtypes(index, [valid_state])[valid_state])
+                buffers.append(buffer)
+            header.points.reader(buffers).read()
+            if valid_state in scan_fields:
+                valid = state == 0
+                del state
+
+            rotation_matrix = translation = None
+            if transform and header.has_pose():
+                rotation_matrix, translation = header.rotation_matrix, header.translation
+            # the valid points are compacted at the beginning of the slice of the scan
+            coordinates, _ = filter_and_transform(columns,
+                                                  others,
+                                                  valid,
+                                                  spherical=transform and coordinate_system is COORDINATE_SYSTEMS.SPHERICAL,
+                                                  rotation_matrix=rotation_matrix,
+                                                  translation=translation,
+                                                  out=columns + others)
+            count = coordinates[0].shape[0]
+            data["scan_index"][position:position + count] = index
+            position += count
+        return {field: array[:position] for field, array in data.items()}
+
+    def read_scans(self, indices=None, *, workers=None, **kwargs) -> List[Dict]:
+        """Reads several scans in parallel, using a pool of `workers` processes.
+
+        Each process opens its own handle on the file and decodes a scan directly into a block
+        of shared memory, which is created when a process is free to decode it. The returned arrays
+        are views of these blocks, they are neither pickled nor copied. A block is sized for all
+        the points of its scan, and released when the arrays of the scan are garbage collected.
+        Keyword arguments are passed to `read_scan`.
+        """
+        if self.image_file.isWritable():
+            raise ValueError("Scans can only be read in parallel from a file opened in 'r' mode")
+        if indices is None:
+            indices = range(self.scan_count)
+        indices = list(indices)
+        if workers is None:
+            workers = min(len(indices), os.cpu_count() or 1)
+        if workers <= 1 or len(indices) <= 1:
+            return [self.read_scan(index, **kwargs) for index in indices]
+
+        path = os.fspath(self.path)
+        pending = list(dict.fromkeys(indices))
+        scans = {}
+        # shared memory block and layout of the scans being decoded
+        blocks = {}
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                while pending or futures:
+                    while pending and len(futures) < workers:
+                        index = pending.pop(0)
+                        layout, size = self._shared_memory_layout(index, kwargs)
+                        if not layout:
+                            scans[index] = self.read_scan(index, **kwargs)
+                            continue
+                        shm = shared_memory.SharedMemory(create=True, size=size)
+                        blocks[index] = shm, layout
+                        future = executor.submit(_read_scan_to_shared_memory, path, self.checksum_policy,
+                                                 index, kwargs, shm.name, layout)
+                        futures[future] = index
+                    if not futures:
+                        continue
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = futures.pop(future)
+                        count = future.result()
+                        shm, layout = blocks.pop(index)
+                        scans[index] = _shared_memory_arrays(shm, layout, count)
+        finally:
+            for shm, _ in blocks.values():
+                shm.close()
+                shm.unlink()
+        return [scans[index] for index in indices]
+
+    def _shared_memory_layout(self, index, kwargs):
+        # the fields returned by read_scan and their types, known from the prototype of the scan
+        header = self.get_header(index)
+        n_points = header.point_count
+        if n_points == 0:
+            return [], 0
+        coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+        options = ["intensity", "colors", "row_column", "fields", "ignore_missing_fields"]
+        fields, valid_state = self._scan_fields(header,
+                                                coordinate_system,
+                                                **{key: kwargs[key] for key in options if key in kwargs})
+        dtypes = self.point_dtypes(index, fields, kwargs.get("dtype_policy", "float64"))
+        dtypes.pop(valid_state, None)
+        # the same fields and order as _finish_points: the transformed coordinates replace
+        # the cartesian ones, and are appended after the spherical ones
+        transform = kwargs.get("transform", True)
+        spherical = transform and coordinate_system is COORDINATE_SYSTEMS.SPHERICAL
+        posed = transform and header.has_pose()
+        if spherical or posed:
+            dtype = transformed_dtype([dtypes[field] for field in coordinate_system.value], posed)
+            dtypes.update((field, dtype) for field in SUPPORTED_CARTESIAN_POINT_FIELDS)
+        layout = []
+        size = 0
+        for field, dtype in dtypes.items():
+            # the offsets are aligned for the arrays that are decoded in place
+            size += -size % dtype.itemsize
+            layout.append((field, dtype.str, size, n_points))
+            size += n_points * dtype.itemsize
+        return layout, size
+
+    def iter_scan(self,
+                  index,
+                  *,
+                  chunk_size=DEFAULT_CHUNK_SIZE,
+                  fields=None,
+                  intensity=False,
+                  colors=False,
+                  row_column=False,
+                  transform=True,
+                  ignore_missing_fields=False,
+                  dtype_policy="float64") -> Iterator[Dict]:
+        """Reads a scan in chunks of at most `chunk_size` points.
+
+        Yields the same dictionaries as `read_scan`, one chunk at a time, so that
+        peak memory depends on `chunk_size` rather than on the size of the scan.
+        `fields` lists extra point fields to read on top of the coordinates.
+        """
+        _check_transform(dtype_policy, transform)
+        header = self.get_header(index)
+        coordinate_system = header.get_coordinate_system(COORDINATE_SYSTEMS)
+        fields, valid_state = self._scan_fields(header,
+                                                coordinate_system,
+                                                intensity=intensity,
+                                                colors=colors,
+                                                row_column=row_column,
+                                                fields=fields,
+                                                ignore_missing_fields=ignore_missing_fields)
+
+        dtypes = self.point_dtypes(index, fields, dtype_policy)
+        for chunk in self._read_chunks(header, dtypes, chunk_size, do_scaling=dtype_policy != "raw"):
+            # the buffers are reused for the next chunk, so they can't be handed out
+            yield self._finish_points(chunk, header, coordinate_system, valid_state, transform, copy=True)
+
+    def iter_scan_raw(self, index, *, chunk_size=DEFAULT_CHUNK_SIZE, fields=None, dtype_policy="float64") -> Iterator[Dict]:
+        """Reads the raw point fields of a scan in chunks of at most `chunk_size` points.
+
+        Unlike `iter_scan`, no filtering or transformation is applied.
+        By default, all the point fields of the scan that can be read are read.
+        """
+        header = self.get_header(index)
+        dtypes = self.point_dtypes(index, fields, dtype_policy)
+        for chunk in self._read_chunks(header, dtypes, chunk_size, do_scaling=dtype_policy != "raw"):
+            yield {field: array.copy() for field, array in chunk.items()}
+
+    def read_scan_arrow(self, index, **kwargs):
+        """Reads a scan as a `pyarrow.Table`, keyword arguments are passed to `read_scan`.
+
+        The columns wrap the decoded arrays without copying them. The schema metadata holds
+        the pose and bounds of the scan, and the metadata of each field its unit and how it is
+        stored in the file (type, limits, scale and offset). Requires pyarrow.
+        """
+        pa = import_pyarrow()
+        data = self.read_scan(index, **kwargs)
+        schema = scan_schema(self.get_header(index), index, data, kwargs.get("transform", True))
+        return pa.Table.from_batches([record_batch(data, schema)], schema)
+
+    def to_record_batches(self, index, *, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        """Reads a scan as a `pyarrow.RecordBatchReader` of at most `chunk_size` points per batch.
+
+        Keyword arguments are passed to `iter_scan`, and the schema is the one of `read_scan_arrow`.
+        The batches are decoded when the reader is consumed, e.g. by `pyarrow.parquet.ParquetWriter`
+        or DuckDB, so the whole scan is never held in memory.
+        """
+        pa = import_pyarrow()
+        chunks = self.iter_scan(index, chunk_size=chunk_size, **kwargs)
+        # the first chunk gives the fields and types of the points
+        first = next(chunks, None)
+        if first is None:
+            first = self.read_scan(index, **kwargs)
+        schema = scan_schema(self.get_header(index), index, first, kwargs.get("transform", True))
+        batches = (record_batch(chunk, schema) for chunk in chain([first], chunks))
+        return pa.RecordBatchReader.from_batches(schema, batches)
+
+    def _read_chunks(self, header, dtypes, chunk_size, do_scaling=True):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        n_points = header.point_count
+        if n_points == 0:
+            return
+        capacity = min(chunk_size, n_points)
+        arrays, buffers = self.make_buffers(list(dtypes), capacity, do_scaling=do_scaling, dtypes=dtypes)
+        reader = header.points.reader(buffers)
+        try:
+            while True:
+                count = reader.read()
+                if count == 0:
+                    break
+                yield {field: array[:count] for field, array in arrays.items()}
+        finally:
+            reader.close()
+
+    def scan_writer(self,
+                    fields,
+                    *,
+                    name=None,
+                    rotation=None,
+                    translation=None,
+                    scan_header=None,
+                    precision="single",
+                    intensity_precision="single",
+                    scale=None,
+                    limits=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE) -> "ScanWriter":
+        """Starts a new scan, whose points are then written in chunks:
+
+            with e57.scan_writer(["cartesianX", "cartesianY", "cartesianZ", "intensity"]) as writer:
+                for chunk in chunks:
+                    writer.write(chunk)
+
+        The bounds, intensity limits and index bounds of the scan are accumulated from the chunks,
+        and written when the writer is closed. `limits` can give the (minimum, maximum) of some fields,
+        which are used in the points prototype for a more compact encoding. When writing scaled integer
+        coordinates, the limits of the coordinates must be known in advance.
+        The other arguments are the same as in `write_scan_raw`.
+
+        The chunks are copied to a staging buffer of `chunk_size` points, which is encoded when it's full.
+        A scan that is already in memory can be written without copies using `ScanWriter.write_all`.
+        If the `with` block raises, the scan is left incomplete: the points that were already encoded
+        stay in the file, without the bounds and limits of the scan.
+        """
+        return ScanWriter(self,
+                          fields,
+                          name=name,
+                          rotation=rotation,
+                          translation=translation,
+                          scan_header=scan_header,
+                          precision=precision,
+                          intensity_precision=intensity_precision,
+                          scale=scale,
+                          limits=limits,
+                          chunk_size=chunk_size)
+
+    def write_scan_raw(self,
+                       data: Dict,
+                       *,
+                       name=None,
+                       rotation=None,
+                       translation=None,
+                       scan_header=None,
+                       precision="single",
+                       intensity_precision="single",
+                       scale=None):
+        """Writes a new scan.
+
+        Coordinates are written as floats of the given `precision` ('single' or 'double'),
+        unless a `scale` is given: they are then written as scaled integers with this resolution
+        (e.g. 0.0001 for 0.1 mm), with an offset and limits derived from their bounding box.
+        This is usually much more compact. The intensity is written as floats of `intensity_precision`.
+        """
         for field in data.keys():
             if field not in SUPPORTED_POINT_FIELDS:
                 raise ValueError("Unsupported point field: %s" % field)
 
+        n_points = data["cartesianX"].shape[0]
+
+        # the whole scan is known, so the prototype can use its exact limits
+        limits = {}
+        x, y, z = data["cartesianX"], data["cartesianY"], data["cartesianZ"]
+        if scale is None:
+            if "cartesianInvalidState" in data:
+                valid = ~data["cartesianInvalidState"].astype("?")
+                x, y, z = x[valid], y[valid], z[valid]
+                del valid
+        # invalid points are written too, so their scaled coordinates must also fit in the raw limits
+        limits["cartesianX"] = np.min(x), np.max(x)
+        limits["cartesianY"] = np.min(y), np.max(y)
+        limits["cartesianZ"] = np.min(z), np.max(z)
+        del x, y, z
+        for field in ["intensity", "rowIndex", "columnIndex", "cartesianInvalidState"]:
+            if field in data:
+                limits[field] = np.min(data[field]), np.max(data[field])
+
+        with self.scan_writer(list(data),
+                              name=name,
+                              rotation=rotation,
+                              translation=translation,
+                              scan_header=scan_header,
+                              precision=precision,
+                              intensity_precision=intensity_precision,
+                              scale=scale,
+                              limits=limits,
+                              chunk_size=max(1, min(n_points, 5000000))) as writer:
+            writer.write_all(data)
+
+
+def _local_bounds(chunk, coordinate_system, valid_state):
+    # x, y, z minimums and maximums of the valid points of a chunk, before the pose of the scan
+    coordinates = [chunk[field] for field in coordinate_system.value]
+    valid = chunk[valid_state] == 0 if valid_state in chunk else None
+    spherical = coordinate_system is COORDINATE_SYSTEMS.SPHERICAL
+    if valid is not None or spherical:
+        coordinates, _ = filter_and_transform(coordinates, valid=valid, spherical=spherical)
+    if coordinates[0].shape[0] == 0:
+        return [np.nan] * 6
+    return [c.min() for c in coordinates] + [c.max() for c in coordinates]
+
+
+def _points_in_box(data, bbox):
+    inside = np.ones(data["cartesianX"].shape[0], bool)
+    for i, field in enumerate(SUPPORTED_CARTESIAN_POINT_FIELDS):
+        inside &= (data[field] >= bbox[0, i]) & (data[field] <= bbox[1, i])
+    return {field: array[inside] for field, array in data.items()}
+
+
+def _boxes_intersect(a, b):
+    return bool(np.all(a[0] <= b[1]) and np.all(b[0] <= a[1]))
+
+
+def _box_to_local(bbox, header):
+    # the smallest box that contains the global box, in the coordinate system of the scan
+    if not header.has_pose():
+        return bbox
+    corners = np.array([[bbox[i, 0], bbox[j, 1], bbox[k, 2]] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+    local = np.dot(corners - header.translation, header.rotation_matrix)
+    return np.array([local.min(axis=0), local.max(axis=0)])
+
+
+def _record_ranges(hits, chunk_size, point_count):
+    # merges the consecutive chunks that are hit into ranges of records
+    ranges = []
+    for chunk in np.flatnonzero(hits):
+        start = int(chunk) * chunk_size
+        stop = min(start + chunk_size, point_count)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _decimate(chunks, decimator, point_count):
+    decimator.begin(point_count)
+    pieces = [decimator.filter(chunk) for chunk in chunks]
+    pieces.append(decimator.end())
+    pieces = [piece for piece in pieces if piece]
+    return {field: np.concatenate([piece[field] for piece in pieces]) for field in pieces[0]}
+
+
+def _check_transform(dtype_policy, transform):
+    if dtype_policy == "raw" and transform:
+        raise ValueError("Raw scaled integers can't be transformed, use transform=False")
+
+
+def _float_precision(precision):
+    if isinstance(precision, libe57.FloatPrecision):
+        return precision
+    precisions = {"single": libe57.E57_SINGLE, "double": libe57.E57_DOUBLE}
+    if precision not in precisions:
+        raise ValueError("Unknown float precision: %s" % precision)
+    return precisions[precision]
+
+
+class ScanWriter:
+    """Writes the points of a new scan in chunks, see `E57.scan_writer`."""
+    def __init__(self,
+                 e57,
+                 fields,
+                 *,
+                 name=None,
+                 rotation=None,
+                 translation=None,
+                 scan_header=None,
+                 precision="single",
+                 intensity_precision="single",
+                 scale=None,
+                 limits=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        precision = _float_precision(precision)
+        intensity_precision = _float_precision(intensity_precision)
+        if scale is not None and not scale > 0:
+            raise ValueError("The scale must be a positive number")
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1")
+        for field in fields:
+            if field not in SUPPORTED_POINT_FIELDS:
+                raise ValueError("Unsupported point field: %s" % field)
+        limits = limits or {}
+
+        field_names = ["cartesianX", "cartesianY", "cartesianZ"]
+        for field in field_names:
+            if field not in fields:
+                raise ValueError("Missing point field: %s" % field)
+        if scale is not None and not all(field in limits for field in field_names):
+            raise ValueError("The limits of the coordinates are required to write scaled integers")
+        if "intensity" in fields:
+            field_names.append("intensity")
+        self.has_colors = all(color in fields for color in ["colorRed", "colorGreen", "colorBlue"])
+        if self.has_colors:
+            field_names += ["colorRed", "colorGreen", "colorBlue"]
+        self.has_row_column = "rowIndex" in fields and "columnIndex" in fields
+        if self.has_row_column:
+            field_names += ["rowIndex", "columnIndex"]
+        if "cartesianInvalidState" in fields:
+            field_names.append("cartesianInvalidState")
+        # other fields
+        # // "sphericalRange"
+        # // "sphericalAzimuth"
+        # // "sphericalElevation"
+        # // "timeStamp"
+        # // "sphericalInvalidState"
+        # // "isColorInvalid"
+        # // "isIntensityInvalid"
+        # // "isTimeStampInvalid"
+
+        self.e57 = e57
+        self.fields = field_names
+        self.chunk_size = chunk_size
+        self.scan_header = scan_header
+        # double precision intensities are staged without going through single precision
+        self.dtypes = {field: np.dtype(SUPPORTED_POINT_FIELDS[field]) for field in field_names}
+        if intensity_precision == libe57.E57_DOUBLE:
+            self.dtypes["intensity"] = np.dtype("d")
+
         if rotation is None:
             rotation = getattr(scan_header, "rotation", np.array([1, 0, 0, 0]))
-
         if translation is None:
             translation = getattr(scan_header, "translation", np.array([0, 0, 0]))
-
         if name is None:
-            name = getattr(scan_header, "name", "Scan %s" % len(self.data3d))
+            name = getattr(scan_header, "name", "Scan %s" % len(e57.data3d))
+        self.rotation = rotation
+        self.translation = translation
+
+        self.scan_node = self._make_scan_node(name)
+        prototype = self._make_prototype(precision, intensity_precision, scale, limits)
+        codecs = libe57.VectorNode(e57.image_file, True)
+        self.points = libe57.CompressedVectorNode(e57.image_file, prototype, codecs)
+        self.scan_node.set("points", self.points)
+        e57.data3d.append(self.scan_node)
+
+        # the writer is created with the buffers of the first write
+        self.writer = None
+        self.staging = None
+        self.staging_buffers = None
+        self.staged_count = 0
+        self.point_count = 0
+        self.closed = False
+        # limits accumulated from the written points
+        self.bb_min = None
+        self.bb_max = None
+        self.minimums = {}
+        self.maximums = {}
 
-        temperature = getattr(scan_header, "temperature", 0)
-        relativeHumidity = getattr(scan_header, "relativeHumidity", 0)
-        atmosphericPressure = getattr(scan_header, "atmosphericPressure", 0)
-
-        scan_node = libe57.StructureNode(self.image_file)
-        scan_node.set("guid", libe57.StringNode(self.image_file, "{%s}" % uuid.uuid4()))
-        scan_node.set("name", libe57.StringNode(self.image_file, name))
-        scan_node.set("temperature", libe57.FloatNode(self.image_file, temperature))
-        scan_node.set("relativeHumidity", libe57.FloatNode(self.image_file, relativeHumidity))
-        scan_node.set("atmosphericPressure", libe57.FloatNode(self.image_file, atmosphericPressure))
-        scan_node.set("description", libe57.StringNode(self.image_file, "pye57 v%s" % __version__))
-
-        n_points = data["cartesianX"].shape[0]
+    def __enter__(self):
+        return self
 
-        ibox = libe57.StructureNode(self.image_file)
-        if "rowIndex" in data and "columnIndex" in data:
-            min_row = np.min(data["rowIndex"])
-            max_row = np.max(data["rowIndex"])
-            min_col = np.min(data["columnIndex"])
-            max_col = np.max(data["columnIndex"])
-            ibox.set("rowMinimum", libe57.IntegerNode(self.image_file, min_row))
-            ibox.set("rowMaximum", libe57.IntegerNode(self.image_file, max_row))
-            ibox.set("columnMinimum", libe57.IntegerNode(self.image_file, min_col))
-            ibox.set("columnMaximum", libe57.IntegerNode(self.image_file, max_col))
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
         else:
-            ibox.set("rowMinimum", libe57.IntegerNode(self.image_file, 0))
-            ibox.set("rowMaximum", libe57.IntegerNode(self.image_file, n_points - 1))
-            ibox.set("columnMinimum", libe57.IntegerNode(self.image_file, 0))
-            ibox.set("columnMaximum", libe57.IntegerNode(self.image_file, 0))
-        ibox.set("returnMinimum", libe57.IntegerNode(self.image_file, 0))
-        ibox.set("returnMaximum", libe57.IntegerNode(self.image_file, 0))
-        scan_node.set("indexBounds", ibox)
+            self._abort()
+
+    def _abort(self):
+        # the scan node can't be removed from the file: the points already encoded are kept,
+        # but the staged ones are dropped and the bounds and limits of the scan aren't written
+        if self.closed:
+            return
+        self.closed = True
+        self.staging = self.staging_buffers = None
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except libe57.E57Exception:
+                # the original exception is more useful, e.g. when the writer itself failed
+                pass
 
-        if "intensity" in data:
-            int_min = getattr(scan_header, "intensityMinimum", np.min(data["intensity"]))
-            int_max = getattr(scan_header, "intensityMaximum", np.max(data["intensity"]))
-            intbox = libe57.StructureNode(self.image_file)
-            intbox.set("intensityMinimum", libe57.FloatNode(self.image_file, int_min))
-            intbox.set("intensityMaximum", libe57.FloatNode(self.image_file, int_max))
-            scan_node.set("intensityLimits", intbox)
-
-        color = all(c in data for c in ["colorRed", "colorGreen", "colorBlue"])
-        if color:
-            colorbox = libe57.StructureNode(self.image_file)
-            colorbox.set("colorRedMinimum", libe57.IntegerNode(self.image_file, 0))
-            colorbox.set("colorRedMaximum", libe57.IntegerNode(self.image_file, 255))
-            colorbox.set("colorGreenMinimum", libe57.IntegerNode(self.image_file, 0))
-            colorbox.set("colorGreenMaximum", libe57.IntegerNode(self.image_file, 255))
-            colorbox.set("colorBlueMinimum", libe57.IntegerNode(self.image_file, 0))
-            colorbox.set("colorBlueMaximum", libe57.IntegerNode(self.image_file, 255))
-            scan_node.set("colorLimits", colorbox)
+    def _make_scan_node(self, name):
+        image_file = self.e57.image_file
+        scan_header = self.scan_header
+        temperature = getattr(scan_header, "temperature", 0)
+        relativeHumidity = getattr(scan_header, "relativeHumidity", 0)
+        atmosphericPressure = getattr(scan_header, "atmosphericPressure", 0)
 
-        bbox_node = libe57.StructureNode(self.image_file)
-        x, y, z = data["cartesianX"], data["cartesianY"], data["cartesianZ"]
-        valid = None
-        if "cartesianInvalidState" in data:
-            valid = ~data["cartesianInvalidState"].astype("?")
-            x, y, z = x[valid], y[valid], z[valid]
-        bb_min = np.array([x.min(), y.min(), z.min()])
-        bb_max = np.array([x.max(), y.max(), z.max()])
-        del valid, x, y, z
+        scan_node = libe57.StructureNode(image_file)
+        scan_node.set("guid", libe57.StringNode(image_file, "{%s}" % uuid.uuid4()))
+        scan_node.set("name", libe57.StringNode(image_file, name))
+        scan_node.set("temperature", libe57.FloatNode(image_file, temperature))
+        scan_node.set("relativeHumidity", libe57.FloatNode(image_file, relativeHumidity))
+        scan_node.set("atmosphericPressure", libe57.FloatNode(image_file, atmosphericPressure))
+        scan_node.set("description", libe57.StringNode(image_file, "pye57 v%s" % __version__))
 
-        if scan_header is not None:
-            bb_min_scaled = np.array([scan_header.xMinimum, scan_header.yMinimum, scan_header.zMinimum])
-            bb_max_scaled = np.array([scan_header.xMaximum, scan_header.yMaximum, scan_header.zMaximum])
-        else:
-            bb_min_scaled = self.to_global(bb_min.reshape(-1, 3), rotation, translation)[0]
-            bb_max_scaled = self.to_global(bb_max.reshape(-1, 3), rotation, translation)[0]
-
-        bbox_node.set("xMinimum", libe57.FloatNode(self.image_file, bb_min_scaled[0]))
-        bbox_node.set("xMaximum", libe57.FloatNode(self.image_file, bb_max_scaled[0]))
-        bbox_node.set("yMinimum", libe57.FloatNode(self.image_file, bb_min_scaled[1]))
-        bbox_node.set("yMaximum", libe57.FloatNode(self.image_file, bb_max_scaled[1]))
-        bbox_node.set("zMinimum", libe57.FloatNode(self.image_file, bb_min_scaled[2]))
-        bbox_node.set("zMaximum", libe57.FloatNode(self.image_file, bb_max_scaled[2]))
-        scan_node.set("cartesianBounds", bbox_node)
-
-        if rotation is not None and translation is not None:
-            pose_node = libe57.StructureNode(self.image_file)
+        if self.rotation is not None and self.translation is not None:
+            pose_node = libe57.StructureNode(image_file)
             scan_node.set("pose", pose_node)
-            rotation_node = libe57.StructureNode(self.image_file)
-            rotation_node.set("w", libe57.FloatNode(self.image_file, rotation[0]))
-            rotation_node.set("x", libe57.FloatNode(self.image_file, rotation[1]))
-            rotation_node.set("y", libe57.FloatNode(self.image_file, rotation[2]))
-            rotation_node.set("z", libe57.FloatNode(self.image_file, rotation[3]))
+            rotation_node = libe57.StructureNode(image_file)
+            rotation_node.set("w", libe57.FloatNode(image_file, self.rotation[0]))
+            rotation_node.set("x", libe57.FloatNode(image_file, self.rotation[1]))
+            rotation_node.set("y", libe57.FloatNode(image_file, self.rotation[2]))
+            rotation_node.set("z", libe57.FloatNode(image_file, self.rotation[3]))
             pose_node.set("rotation", rotation_node)
-            translation_node = libe57.StructureNode(self.image_file)
-            translation_node.set("x", libe57.FloatNode(self.image_file, translation[0]))
-            translation_node.set("y", libe57.FloatNode(self.image_file, translation[1]))
-            translation_node.set("z", libe57.FloatNode(self.image_file, translation[2]))
+            translation_node = libe57.StructureNode(image_file)
+            translation_node.set("x", libe57.FloatNode(image_file, self.translation[0]))
+            translation_node.set("y", libe57.FloatNode(image_file, self.translation[1]))
+            translation_node.set("z", libe57.FloatNode(image_file, self.translation[2]))
             pose_node.set("translation", translation_node)
 
         start_datetime = getattr(scan_header, "acquisitionStart_dateTimeValue", 0)
         start_atomic = getattr(scan_header, "acquisitionStart_isAtomicClockReferenced", False)
         end_datetime = getattr(scan_header, "acquisitionEnd_dateTimeValue", 0)
         end_atomic = getattr(scan_header, "acquisitionEnd_isAtomicClockReferenced", False)
-        acquisition_start = libe57.StructureNode(self.image_file)
+        acquisition_start = libe57.StructureNode(image_file)
         scan_node.set("acquisitionStart", acquisition_start)
-        acquisition_start.set("dateTimeValue", libe57.FloatNode(self.image_file, start_datetime))
-        acquisition_start.set("isAtomicClockReferenced", libe57.IntegerNode(self.image_file, start_atomic))
-        acquisition_end = libe57.StructureNode(self.image_file)
+        acquisition_start.set("dateTimeValue", libe57.FloatNode(image_file, start_datetime))
+        acquisition_start.set("isAtomicClockReferenced", libe57.IntegerNode(image_file, start_atomic))
+        acquisition_end = libe57.StructureNode(image_file)
         scan_node.set("acquisitionEnd", acquisition_end)
-        acquisition_end.set("dateTimeValue", libe57.FloatNode(self.image_file, end_datetime))
-        acquisition_end.set("isAtomicClockReferenced", libe57.IntegerNode(self.image_file, end_atomic))
+        acquisition_end.set("dateTimeValue", libe57.FloatNode(image_file, end_datetime))
+        acquisition_end.set("isAtomicClockReferenced", libe57.IntegerNode(image_file, end_atomic))
 
         # todo: pointGroupingSchemes
 
-        points_prototype = libe57.StructureNode(self.image_file)
-
-        is_scaled = False
-        precision = libe57.E57_DOUBLE if is_scaled else libe57.E57_SINGLE
-
-        center = (bb_max + bb_min) / 2
-
-        chunk_size = 5000000
-
-        x_node = libe57.FloatNode(self.image_file, center[0], precision, bb_min[0], bb_max[0])
-        y_node = libe57.FloatNode(self.image_file, center[1], precision, bb_min[1], bb_max[1])
-        z_node = libe57.FloatNode(self.image_file, center[2], precision, bb_min[2], bb_max[2])
-        points_prototype.set("cartesianX", x_node)
-        points_prototype.set("cartesianY", y_node)
-        points_prototype.set("cartesianZ", z_node)
-
-        field_names = ["cartesianX", "cartesianY", "cartesianZ"]
-
-        if "intensity" in data:
-            intensity_min = np.min(data["intensity"])
-            intensity_max = np.max(data["intensity"])
-            intensity_node = libe57.FloatNode(self.image_file, intensity_min, precision, intensity_min, intensity_max)
-            points_prototype.set("intensity", intensity_node)
-            field_names.append("intensity")
-
-        if all(color in data for color in ["colorRed", "colorGreen", "colorBlue"]):
-            points_prototype.set("colorRed", libe57.IntegerNode(self.image_file, 0, 0, 255))
-            points_prototype.set("colorGreen", libe57.IntegerNode(self.image_file, 0, 0, 255))
-            points_prototype.set("colorBlue", libe57.IntegerNode(self.image_file, 0, 0, 255))
-            field_names.append("colorRed")
-            field_names.append("colorGreen")
-            field_names.append("colorBlue")
-
-        if "rowIndex" in data and "columnIndex" in data:
-            min_row = np.min(data["rowIndex"])
-            max_row = np.max(data["rowIndex"])
-            min_col = np.min(data["columnIndex"])
-            max_col = np.max(data["columnIndex"])
-            points_prototype.set("rowIndex", libe57.IntegerNode(self.image_file, min_row, min_row, max_row))
-            field_names.append("rowIndex")
-            points_prototype.set("columnIndex", libe57.IntegerNode(self.image_file, min_col, min_col, max_col))
-            field_names.append("columnIndex")
-
-        if "cartesianInvalidState" in data:
-            min_state = np.min(data["cartesianInvalidState"])
-            max_state = np.max(data["cartesianInvalidState"])
-            points_prototype.set("cartesianInvalidState", libe57.IntegerNode(self.image_file, 0, min_state, max_state))
-            field_names.append("cartesianInvalidState")
-
-        # other fields
-        # // "sphericalRange"
-        # // "sphericalAzimuth"
-        # // "sphericalElevation"
-        # // "timeStamp"
-        # // "sphericalInvalidState"
-        # // "isColorInvalid"
-        # // "isIntensityInvalid"
-        # // "isTimeStampInvalid"
+        return scan_node
 
-        arrays, buffers = self.make_buffers(field_names, chunk_size)
+    def _make_prototype(self, precision, intensity_precision, scale, limits):
+        image_file = self.e57.image_file
+        points_prototype = libe57.StructureNode(image_file)
 
-        codecs = libe57.VectorNode(self.image_file, True)
-        points = libe57.CompressedVectorNode(self.image_file, points_prototype, codecs)
-        scan_node.set("points", points)
+        for field in ["cartesianX", "cartesianY", "cartesianZ"]:
+            if scale is not None:
+                minimum, maximum = np.array(limits[field], dtype="d")
+                offset = np.round((minimum + maximum) / 2 / scale) * scale
+                raw_min = np.floor((minimum - offset) / scale)
+                raw_max = np.ceil((maximum - offset) / scale)
+                node = libe57.ScaledIntegerNode(image_file, 0, int(raw_min), int(raw_max), float(scale), float(offset))
+            else:
+                minimum, maximum = limits.get(field, _float_limits(precision))
+                center = (maximum + minimum) / 2
+                node = libe57.FloatNode(image_file, center, precision, minimum, maximum)
+            points_prototype.set(field, node)
+
+        if "intensity" in self.fields:
+            minimum, maximum = limits.get("intensity", _float_limits(intensity_precision))
+            center = (maximum + minimum) / 2
+            points_prototype.set("intensity", libe57.FloatNode(image_file, center, intensity_precision,
+                                                               minimum, maximum))
+
+        default_integer_limits = {"colorRed": (0, 255), "colorGreen": (0, 255), "colorBlue": (0, 255),
+                                  "cartesianInvalidState": (0, 2)}
+        for field in ["colorRed", "colorGreen", "colorBlue", "rowIndex", "columnIndex", "cartesianInvalidState"]:
+            if field in self.fields:
+                iinfo = np.iinfo(SUPPORTED_POINT_FIELDS[field])
+                default = default_integer_limits.get(field, (iinfo.min, iinfo.max))
+                minimum, maximum = limits.get(field, default)
+                points_prototype.set(field, libe57.IntegerNode(image_file, minimum, minimum, maximum))
+
+        return points_prototype
+
+    def write(self, data: Dict):
+        """Writes a chunk of points, given as a dictionary of arrays with one entry per field."""
+        arrays = self._chunk_arrays(data)
+        n_points = arrays["cartesianX"].shape[0]
+        if n_points == 0:
+            return
+        self._update_limits(arrays)
+
+        if self.staging is None:
+            self.staging = {}
+            self.staging_buffers = libe57.VectorSourceDestBuffer()
+            for field in self.fields:
+                out = np.empty(self.chunk_size, self.dtypes[field])
+                self.staging[field], buffer = self.e57.make_buffer(field, self.chunk_size, out=out)
+                self.staging_buffers.append(buffer)
+        position = 0
+        while position < n_points:
+            count = min(n_points - position, self.chunk_size - self.staged_count)
+            for field, array in arrays.items():
+                self.staging[field][self.staged_count:self.staged_count + count] = array[position:position + count]
+            self.staged_count += count
+            position += count
+            if self.staged_count == self.chunk_size:
+                self._flush()
+        self.point_count += n_points
+
+    def write_all(self, data: Dict):
+        """Writes all the points of the scan at once, and closes the writer.
+
+        When the arrays already have the types of the fields, they are encoded directly, without copies.
+        """
+        arrays = self._chunk_arrays(data)
+        n_points = arrays["cartesianX"].shape[0]
+        # the writer keeps encoding from the buffers it was created with,
+        # so the arrays can only be used directly if nothing was written before them
+        can_write_directly = self.writer is None and self.staged_count == 0 and n_points > 0
+        if can_write_directly and all(array.dtype == self.dtypes[field] for field, array in arrays.items()):
+            self._update_limits(arrays)
+            buffers = libe57.VectorSourceDestBuffer()
+            for field, array in arrays.items():
+                _, buffer = self.e57.make_buffer(field, n_points, out=array)
+                buffers.append(buffer)
+            self.writer = self.points.writer(buffers)
+            self.writer.write(n_points)
+            self.point_count += n_points
+        else:
+            self.write(arrays)
+        self.close()
 
-        self.data3d.append(scan_node)
+    def _chunk_arrays(self, data):
+        if self.closed:
+            raise ValueError("The scan writer is closed")
+        for field in self.fields:
+            if field not in data:
+                raise ValueError("Missing point field: %s" % field)
+        arrays = {field: np.asarray(data[field]) for field in self.fields}
+        n_points = arrays["cartesianX"].shape[0]
+        for array in arrays.values():
+            if array.ndim != 1 or array.shape[0] != n_points or array.strides[0] <= 0:
+                raise ValueError("The point fields must be 1d arrays of the same length")
+        return arrays
+
+    def _flush(self):
+        if self.staged_count:
+            if self.writer is None:
+                self.writer = self.points.writer(self.staging_buffers)
+            self.writer.write(self.staged_count)
+            self.staged_count = 0
+
+    def _update_limits(self, arrays):
+        x, y, z = arrays["cartesianX"], arrays["cartesianY"], arrays["cartesianZ"]
+        if "cartesianInvalidState" in arrays:
+            valid = ~arrays["cartesianInvalidState"].astype("?")
+            x, y, z = x[valid], y[valid], z[valid]
+        if x.shape[0]:
+            bb_min = np.array([x.min(), y.min(), z.min()])
+            bb_max = np.array([x.max(), y.max(), z.max()])
+            self.bb_min = bb_min if self.bb_min is None else np.minimum(self.bb_min, bb_min)
+            self.bb_max = bb_max if self.bb_max is None else np.maximum(self.bb_max, bb_max)
+        for field in ["intensity", "rowIndex", "columnIndex"]:
+            if field in arrays:
+                minimum = np.min(arrays[field])
+                maximum = np.max(arrays[field])
+                self.minimums[field] = min(self.minimums.get(field, minimum), minimum)
+                self.maximums[field] = max(self.maximums.get(field, maximum), maximum)
 
-        writer = points.writer(buffers)
+    def close(self):
+        """Writes the remaining points, and the limits of the scan."""
+        if self.closed:
+            return
+        self.closed = True
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+        self.staging = self.staging_buffers = None
+
+        image_file = self.e57.image_file
+        scan_header = self.scan_header
+        scan_node = self.scan_node
+
+        ibox = libe57.StructureNode(image_file)
+        if self.has_row_column and self.point_count:
+            ibox.set("rowMinimum", libe57.IntegerNode(image_file, self.minimums["rowIndex"]))
+            ibox.set("rowMaximum", libe57.IntegerNode(image_file, self.maximums["rowIndex"]))
+            ibox.set("columnMinimum", libe57.IntegerNode(image_file, self.minimums["columnIndex"]))
+            ibox.set("columnMaximum", libe57.IntegerNode(image_file, self.maximums["columnIndex"]))
+        else:
+            ibox.set("rowMinimum", libe57.IntegerNode(image_file, 0))
+            ibox.set("rowMaximum", libe57.IntegerNode(image_file, self.point_count - 1))
+            ibox.set("columnMinimum", libe57.IntegerNode(image_file, 0))
+            ibox.set("columnMaximum", libe57.IntegerNode(image_file, 0))
+        ibox.set("returnMinimum", libe57.IntegerNode(image_file, 0))
+        ibox.set("returnMaximum", libe57.IntegerNode(image_file, 0))
+        scan_node.set("indexBounds", ibox)
 
-        current_index = 0
-        while current_index != n_points:
-            current_chunk = min(n_points - current_index, chunk_size)
+        if "intensity" in self.fields:
+            int_min = getattr(scan_header, "intensityMinimum", self.minimums.get("intensity"))
+            int_max = getattr(scan_header, "intensityMaximum", self.maximums.get("intensity"))
+            if int_min is not None and int_max is not None:
+                intbox = libe57.StructureNode(image_file)
+                intbox.set("intensityMinimum", libe57.FloatNode(image_file, int_min))
+                intbox.set("intensityMaximum", libe57.FloatNode(image_file, int_max))
+                scan_node.set("intensityLimits", intbox)
+
+        if self.has_colors:
+            colorbox = libe57.StructureNode(image_file)
+            colorbox.set("colorRedMinimum", libe57.IntegerNode(image_file, 0))
+            colorbox.set("colorRedMaximum", libe57.IntegerNode(image_file, 255))
+            colorbox.set("colorGreenMinimum", libe57.IntegerNode(image_file, 0))
+            colorbox.set("colorGreenMaximum", libe57.IntegerNode(image_file, 255))
+            colorbox.set("colorBlueMinimum", libe57.IntegerNode(image_file, 0))
+            colorbox.set("colorBlueMaximum", libe57.IntegerNode(image_file, 255))
+            scan_node.set("colorLimits", colorbox)
 
-            for type_ in SUPPORTED_POINT_FIELDS:
-                if type_ in arrays:
-                    arrays[type_][:current_chunk] = data[type_][current_index:current_index + current_chunk]
+        if scan_header is not None:
+            bb_min_scaled = np.array([scan_header.xMinimum, scan_header.yMinimum, scan_header.zMinimum])
+            bb_max_scaled = np.array([scan_header.xMaximum, scan_header.yMaximum, scan_header.zMaximum])
+        elif self.bb_min is not None:
+            bb_min_scaled = self.e57.to_global(self.bb_min.reshape(-1, 3), self.rotation, self.translation)[0]
+            bb_max_scaled = self.e57.to_global(self.bb_max.reshape(-1, 3), self.rotation, self.translation)[0]
+        else:
+            return
+        bbox_node = libe57.StructureNode(image_file)
+        bbox_node.set("xMinimum", libe57.FloatNode(image_file, bb_min_scaled[0]))
+        bbox_node.set("xMaximum", libe57.FloatNode(image_file, bb_max_scaled[0]))
+        bbox_node.set("yMinimum", libe57.FloatNode(image_file, bb_min_scaled[1]))
+        bbox_node.set("yMaximum", libe57.FloatNode(image_file, bb_max_scaled[1]))
+        bbox_node.set("zMinimum", libe57.FloatNode(image_file, bb_min_scaled[2]))
+        bbox_node.set("zMaximum", libe57.FloatNode(image_file, bb_max_scaled[2]))
+        scan_node.set("cartesianBounds", bbox_node)
 
-            writer.write(current_chunk)
 
-            current_index += current_chunk
+def _float_limits(precision):
+    if precision == libe57.E57_SINGLE:
+        return libe57.E57_FLOAT_MIN, libe57.E57_FLOAT_MAX
+    return libe57.E57_DOUBLE_MIN, libe57.E57_DOUBLE_MAX
+
+
+class _RangeReader:
+    """Keeps a CompressedVectorReader open, and remembers which records are in its buffers."""
+    def __init__(self, e57, header, dtypes, capacity):
+        self.fields = list(dtypes)
+        self.arrays, self.buffers = e57.make_buffers(self.fields, capacity, dtypes=dtypes)
+        self.reader = header.points.reader(self.buffers)
+        self.can_seek = True
+        # index of the next record to be decoded
+        self.position = 0
+        # records currently held in the buffers
+        self.chunk_start = 0
+        self.chunk_count = 0
+
+    def read(self, start, stop, data):
+        position = start
+        while position < stop:
+            chunk_stop = self.chunk_start + self.chunk_count
+            if self.chunk_start <= position < chunk_stop:
+                count = min(chunk_stop, stop) - position
+                offset = position - self.chunk_start
+                for field, array in self.arrays.items():
+                    data[field][position - start:position - start + count] = array[offset:offset + count]
+                position += count
+                continue
+            if position > self.position and self.can_seek:
+                try:
+                    self.reader.seek(position)
+                    self.position = position
+                except libe57.E57Exception:
+                    # seeking isn't implemented by all versions of libE57Format,
+                    # the records before the window are decoded and skipped instead
+                    self.can_seek = False
+            count = self.reader.read()
+            if count == 0:
+                raise ValueError("Record %s is out of range" % position)
+            self.chunk_start = self.position
+            self.chunk_count = count
+            self.position += count
 
-        writer.close()
+    def close(self):
+        if self.reader.isOpen():
+            self.reader.close()
+
+
+def _read_scan_to_shared_memory(path, checksum_policy, index, kwargs, name, layout):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return _read_scan_to_buffer(path, checksum_policy, index, kwargs, shm.buf, layout)
+    except BaseException as e:
+        # the frames of the traceback still refer to the arrays of the block, which can't be closed
+        # while they are alive. The worker process is reused, so they are released here.
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        shm.close()
+
+
+def _read_scan_to_buffer(path, checksum_policy, index, kwargs, buffer, layout):
+    # the arrays of the block only live in this frame, they are released when it returns.
+    # np.frombuffer holds the buffer, so the block can't be closed while they are alive.
+    out = {field: np.frombuffer(buffer, dtype, size, offset) for field, dtype, offset, size in layout}
+    with E57(path, checksum_policy=checksum_policy) as e57:
+        if kwargs.get("decimate") is None:
+            data = e57._read_scan_into(index, out, **kwargs)
+        else:
+            # the decimated points are only known once the whole scan is read
+            data = e57.read_scan(index, **kwargs)
+            for field, array in data.items():
+                out[field][:array.shape[0]] = array
+    return next(iter(data.values())).shape[0]
+
+
+def _shared_memory_arrays(shm, layout, count):
+    # the arrays of a scan are views of its block, which is closed when they are all released.
+    # Unlinking the block only removes its name, its memory stays mapped until then.
+    block = np.ndarray(shm.size, np.uint8, buffer=shm.buf)
+    weakref.finalize(block, shm.close)
+    shm.unlink()
+    return {field: block[offset:offset + count * np.dtype(dtype).itemsize].view(dtype)
+            for field, dtype, offset, _ in layout}
@@ -0,0 +1,236 @@
+import json
+import os
+import struct
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+import numpy as np
+
+from pye57.__version__ import __version__
+
+E57_SIGNATURE = b"ASTM-E57"
+# signature, major and minor versions, file length, xml offset, xml length, page size
+FILE_HEADER_FORMAT = "<8sIIQQQQ"
+# each physical page ends with a 4 bytes checksum
+PAGE_CHECKSUM_SIZE = 4
+# bump this when the content of the index changes
+INDEX_FORMAT_VERSION = 1
+
+# these nodes hold point data, they are summarized separately
+SKIPPED_SCAN_NODES = {"points", "pointGroupingSchemes"}
+
+
+def read_xml_section(path) -> bytes:
+    """Reads the XML section of an E57 file, without reading the binary sections."""
+    with open(path, "rb") as f:
+        header = f.read(struct.calcsize(FILE_HEADER_FORMAT))
+        if len(header) != struct.calcsize(FILE_HEADER_FORMAT):
+            raise ValueError("Not an E57 file: %s" % path)
+        signature, _, _, _, xml_offset, xml_length, page_size = struct.unpack(FILE_HEADER_FORMAT, header)
+        if signature != E57_SIGNATURE or page_size <= PAGE_CHECKSUM_SIZE:
+            raise ValueError("Not an E57 file: %s" % path)
+
+        logical_page_size = page_size - PAGE_CHECKSUM_SIZE
+        xml = bytearray()
+        physical_offset = xml_offset
+        while len(xml) < xml_length:
+            page_offset = physical_offset % page_size
+            count = min(logical_page_size - page_offset, xml_length - len(xml))
+            f.seek(physical_offset)
+            data = f.read(count)
+            if len(data) != count:
+                raise ValueError("Truncated E57 file: %s" % path)
+            xml += data
+            physical_offset += page_size - page_offset
+    return bytes(xml)
+
+
+def index_file(path, cache=False) -> dict:
+    """Summarizes the scans of an E57 file by parsing only its XML section.
+
+    Returns a dictionary that can be serialized to json, with one entry in 'scans' for each
+    scan: its metadata (guid, name, bounds, pose, ...), point count and point fields.
+
+    With `cache=True`, the summary is also saved next to the file, in `<path>.index.json`
+    (or in the path given to `cache`). It is reused as long as the size and
+    modification time of the E57 file don't change.
+    """
+    stat = os.stat(path)
+    cache_path = None
+    if cache:
+        cache_path = cache if isinstance(cache, (str, os.PathLike)) else os.fspath(path) + ".index.json"
+        index = _read_cached_index(cache_path, stat)
+        if index is not None:
+            return index
+
+    index = _parse_index(read_xml_section(path))
+    index["size"] = stat.st_size
+
+    if cache_path is not None:
+        _write_cached_index(cache_path, stat, index)
+    return index
+
+
+def _parse_index(xml: bytes) -> dict:
+    namespaces = {}
+    root = None
+    for event, item in ET.iterparse(BytesIO(xml), events=("start-ns", "end")):
+        if event == "start-ns":
+            prefix, uri = item
+            namespaces[uri] = prefix
+        else:
+            # the last element to end is the root
+            root = item
+
+    def element_name(element):
+        if element.tag.startswith("{"):
+            uri, name = element.tag[1:].split("}", 1)
+            prefix = namespaces.get(uri, "")
+            return "%s:%s" % (prefix, name) if prefix else name
+        return element.tag
+
+    def children(element):
+        return {element_name(child): child for child in element}
+
+    def value(element):
+        type_ = element.get("type")
+        text = (element.text or "").strip()
+        if type_ == "Structure":
+            return {name: value(child) for name, child in children(element).items()}
+        elif type_ == "Vector":
+            return [value(child) for child in element]
+        elif type_ == "Integer":
+            return int(text) if text else 0
+        elif type_ == "ScaledInteger":
+            raw = int(text) if text else 0
+            return raw * float(element.get("scale", 1.0)) + float(element.get("offset", 0.0))
+        elif type_ == "Float":
+            return float(text) if text else 0.0
+        elif type_ == "String":
+            return element.text or ""
+        elif type_ == "Blob":
+            return {"type": "Blob", "length": int(element.get("length", 0))}
+        elif type_ == "CompressedVector":
+            return {"type": "CompressedVector", "recordCount": int(element.get("recordCount", 0))}
+
+    def field_schema(element):
+        schema = {"type": element.get("type")}
+        for attribute in ("precision", "minimum", "maximum", "scale", "offset"):
+            if element.get(attribute) is not None:
+                schema[attribute] = element.get(attribute)
+        if schema["type"] == "Float":
+            schema["precision"] = schema.get("precision", "double")
+            for attribute in ("minimum", "maximum"):
+                if attribute in schema:
+                    schema[attribute] = float(schema[attribute])
+        elif schema["type"] in ("Integer", "ScaledInteger"):
+            for attribute in ("minimum", "maximum"):
+                if attribute in schema:
+                    schema[attribute] = int(schema[attribute])
+            for attribute in ("scale", "offset"):
+                if attribute in schema:
+                    schema[attribute] = float(schema[attribute])
+        return schema
+
+    def scan_summary(element):
+        nodes = children(element)
+        scan = {name: value(child) for name, child in nodes.items() if name not in SKIPPED_SCAN_NODES}
+        points = nodes["points"]
+        scan["point_count"] = int(points.get("recordCount", 0))
+        prototype = children(points).get("prototype")
+        scan["point_fields"] = {} if prototype is None else {
+            name: field_schema(child) for name, child in children(prototype).items()
+        }
+        pose = scan.get("pose", {})
+        rotation = pose.get("rotation", {"w": 1.0, "x": 0.0, "y": 0.0, "z": 0.0})
+        scan["rotation"] = [rotation.get(axis, 0.0) for axis in "wxyz"]
+        translation = pose.get("translation", {})
+        scan["translation"] = [translation.get(axis, 0.0) for axis in "xyz"]
+        return scan
+
+    root_nodes = children(root)
+    data3d = root_nodes.get("data3D")
+    images2d = root_nodes.get("images2D")
+    scans = [] if data3d is None else [scan_summary(scan) for scan in data3d]
+    return {
+        "guid": value(root_nodes["guid"]) if "guid" in root_nodes else "",
+        "versionMajor": value(root_nodes["versionMajor"]) if "versionMajor" in root_nodes else 0,
+        "versionMinor": value(root_nodes["versionMinor"]) if "versionMinor" in root_nodes else 0,
+        "scan_count": len(scans),
+        "image_count": 0 if images2d is None else len(images2d),
+        "scans": scans,
+    }
+
+
+def _read_cached_index(cache_path, stat):
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cached.get("format_version") != INDEX_FORMAT_VERSION
+            or cached.get("size") != stat.st_size
+            or cached.get("mtime_ns") != stat.st_mtime_ns):
+        return None
+    return cached.get("index")
+
+
+def _write_cached_index(cache_path, stat, index):
+    cached = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "pye57_version": __version__,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "index": index,
+    }
+    temp_path = "%s.%s.tmp" % (cache_path, os.getpid())
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(cached, f)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # the cache is optional, a read-only location shouldn't prevent indexing
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def scan_chunk_bounds(e57, indices, chunk_size, cache=False) -> dict:
+    """Returns the bounds of the valid points of each chunk of `chunk_size` records of some scans.
+
+    The bounds are in the coordinate system of the scans (before their pose), as a (n_chunks, 6) array
+    of x, y, z minimums and maximums, with NaN for the chunks without valid points.
+    Computing them decodes the scans, so with `cache=True` they are saved next to the file,
+    in `<path>.chunks.json` (or in the path given to `cache`), and reused until the file changes.
+    """
+    bounds = read_cached_chunk_bounds(e57, chunk_size, cache) if cache else {}
+    missing = {index: e57.chunk_bounds(index, chunk_size) for index in indices if index not in bounds}
+    if cache and missing:
+        save_chunk_bounds(e57, chunk_size, missing, cache)
+    bounds.update(missing)
+    return {index: bounds[index] for index in indices}
+
+
+def _chunk_bounds_path(e57, cache):
+    return cache if isinstance(cache, (str, os.PathLike)) else os.fspath(e57.path) + ".chunks.json"
+
+
+def read_cached_chunk_bounds(e57, chunk_size, cache=True) -> dict:
+    """Returns the chunk bounds saved by `save_chunk_bounds`, by scan index, without decoding any scan.
+
+    Nothing is returned when they were saved for another chunk size, or before the file changed.
+    """
+    cached = _read_cached_index(_chunk_bounds_path(e57, cache), os.stat(e57.path)) or {}
+    if cached.get("chunk_size") != chunk_size:
+        return {}
+    return {int(index): np.array(bounds, dtype=float).reshape(-1, 6) for index, bounds in cached["scans"].items()}
+
+
+def save_chunk_bounds(e57, chunk_size, bounds, cache=True):
+    """Saves the chunk bounds of some scans next to the file, along with the ones already saved."""
+    cache_path = _chunk_bounds_path(e57, cache)
+    stat = os.stat(e57.path)
+    scans = {str(index): array.tolist() for index, array in read_cached_chunk_bounds(e57, chunk_size, cache).items()}
+    scans.update((str(index), np.asarray(array).tolist()) for index, array in bounds.items())
+    _write_cached_index(cache_path, stat, {"chunk_size": chunk_size, "scans": scans})
@@ -0,0 +1,134 @@
+from functools import cached_property
+
+from pye57 import libe57
+from pye57.node_header import NodeHeader
+from pye57.utils import get_fields
+
+# the ways an image can be projected, in the order they are looked for
+IMAGE_REPRESENTATIONS = [
+    "pinholeRepresentation",
+    "sphericalRepresentation",
+    "cylindricalRepresentation",
+    "visualReferenceRepresentation",
+]
+
+IMAGE_FORMATS = {
+    "jpegImage": "jpeg",
+    "pngImage": "png",
+}
+
+
+class ImageHeader(NodeHeader):
+    """Provides the information of an image of the images2D section of an E57 file.
+
+    Including its representation (pinhole, spherical, ...), size, format and pose.
+    The image itself is stored as an encoded (jpeg or png) blob, see `E57.read_image`.
+    """
+    @cached_property
+    def fields(self):
+        return get_fields(self.node)
+
+    @cached_property
+    def representation_name(self):
+        for name in IMAGE_REPRESENTATIONS:
+            if self.node.isDefined(name):
+                return name
+        raise ValueError("Image %s has no supported representation" % self.node.pathName())
+
+    @property
+    def representation(self):
+        return self.node[self.representation_name]
+
+    @cached_property
+    def _blob_name(self):
+        representation = self.representation
+        for name in IMAGE_FORMATS:
+            if representation.isDefined(name):
+                return name
+        raise ValueError("Image %s has no jpeg or png image" % self.node.pathName())
+
+    @property
+    def image_format(self):
+        return IMAGE_FORMATS[self._blob_name]
+
+    @property
+    def blob(self):
+        return self.representation[self._blob_name]
+
+    @property
+    def byte_count(self):
+        return self.blob.byteCount()
+
+    def has_mask(self):
+        return self.representation.isDefined("imageMask")
+
+    @property
+    def mask_blob(self):
+        return self.representation["imageMask"]
+
+    @property
+    def guid(self):
+        return self._value("guid")
+
+    @property
+    def name(self):
+        return self._value("name")
+
+    @property
+    def description(self):
+        return self._value("description")
+
+    @property
+    def associatedData3DGuid(self):
+        return self._value("associatedData3DGuid")
+
+    @property
+    def sensorVendor(self):
+        return self._value("sensorVendor")
+
+    @property
+    def sensorModel(self):
+        return self._value("sensorModel")
+
+    @property
+    def sensorSerialNumber(self):
+        return self._value("sensorSerialNumber")
+
+    @property
+    def imageWidth(self):
+        return self._value(self.representation_name, "imageWidth")
+
+    @property
+    def imageHeight(self):
+        return self._value(self.representation_name, "imageHeight")
+
+    @property
+    def pixelWidth(self):
+        return self._value(self.representation_name, "pixelWidth")
+
+    @property
+    def pixelHeight(self):
+        return self._value(self.representation_name, "pixelHeight")
+
+    @property
+    def focalLength(self):
+        return self._value(self.representation_name, "focalLength")
+
+    @property
+    def principalPointX(self):
+        return self._value(self.representation_name, "principalPointX")
+
+    @property
+    def principalPointY(self):
+        return self._value(self.representation_name, "principalPointY")
+
+    @property
+    def radius(self):
+        return self._value(self.representation_name, "radius")
+
+    def __repr__(self):
+        try:
+            name = self.name
+        except libe57.E57Exception:
+            name = self.node.pathName()
+        return "<ImageHeader '%s'>" % name
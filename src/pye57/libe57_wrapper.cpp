@@ -7,8 +7,11 @@
 #include <E57Format.h>
 #include <E57Version.h>
 #include <ASTMVersion.h>
+#include <deque>
 #include <sstream>
 #include <string.h>
+#include <utility>
+#include <vector>
 
 namespace py = pybind11;
 using namespace pybind11::literals;
@@ -37,6 +40,148 @@ auto cast_node (Node &n) {
         return py::cast(VectorNode(n));
 }
 
+Node as_node(py::handle obj) {
+    if (py::isinstance<StructureNode>(obj))
+        return obj.cast<StructureNode>();
+    else if (py::isinstance<VectorNode>(obj))
+        return obj.cast<VectorNode>();
+    else if (py::isinstance<CompressedVectorNode>(obj))
+        return obj.cast<CompressedVectorNode>();
+    else if (py::isinstance<IntegerNode>(obj))
+        return obj.cast<IntegerNode>();
+    else if (py::isinstance<ScaledIntegerNode>(obj))
+        return obj.cast<ScaledIntegerNode>();
+    else if (py::isinstance<FloatNode>(obj))
+        return obj.cast<FloatNode>();
+    else if (py::isinstance<StringNode>(obj))
+        return obj.cast<StringNode>();
+    else if (py::isinstance<BlobNode>(obj))
+        return obj.cast<BlobNode>();
+    return obj.cast<Node>();
+}
+
+using CompressedVectorPairs = std::vector<std::pair<CompressedVectorNode, CompressedVectorNode>>;
+using BlobPairs = std::vector<std::pair<BlobNode, BlobNode>>;
+
+// Copies a node to another image file, recursively. The binary data of the compressed vectors
+// and blobs isn't copied: their (source, destination) pairs are collected to copy it afterwards,
+// once the whole tree is created.
+Node copy_node(const Node &node, ImageFile &dest, CompressedVectorPairs &compressed_vectors, BlobPairs &blobs) {
+    NodeType type = node.type();
+    if (type == NodeType::E57_FLOAT) {
+        FloatNode n(node);
+        return FloatNode(dest, n.value(), n.precision(), n.minimum(), n.maximum());
+    } else if (type == NodeType::E57_INTEGER) {
+        IntegerNode n(node);
+        return IntegerNode(dest, n.value(), n.minimum(), n.maximum());
+    } else if (type == NodeType::E57_SCALED_INTEGER) {
+        ScaledIntegerNode n(node);
+        return ScaledIntegerNode(dest, n.rawValue(), n.minimum(), n.maximum(), n.scale(), n.offset());
+    } else if (type == NodeType::E57_STRING) {
+        StringNode n(node);
+        return StringNode(dest, n.value());
+    } else if (type == NodeType::E57_BLOB) {
+        BlobNode n(node);
+        BlobNode out(dest, n.byteCount());
+        blobs.emplace_back(n, out);
+        return out;
+    } else if (type == NodeType::E57_COMPRESSED_VECTOR) {
+        CompressedVectorNode n(node);
+        Node prototype = copy_node(n.prototype(), dest, compressed_vectors, blobs);
+        VectorNode codecs(copy_node(n.codecs(), dest, compressed_vectors, blobs));
+        CompressedVectorNode out(dest, prototype, codecs);
+        compressed_vectors.emplace_back(n, out);
+        return out;
+    } else if (type == NodeType::E57_STRUCTURE) {
+        StructureNode n(node);
+        StructureNode out(dest);
+        for (int64_t i = 0; i < n.childCount(); ++i) {
+            Node child = n.get(i);
+            out.set(child.elementName(), copy_node(child, dest, compressed_vectors, blobs));
+        }
+        return out;
+    } else if (type == NodeType::E57_VECTOR) {
+        VectorNode n(node);
+        VectorNode out(dest, n.allowHeteroChildren());
+        for (int64_t i = 0; i < n.childCount(); ++i) {
+            out.append(copy_node(n.get(i), dest, compressed_vectors, blobs));
+        }
+        return out;
+    }
+    throw std::runtime_error("Unknown node type");
+}
+
+// Memory shared by the reader of the source compressed vector and the writer of the destination,
+// with one buffer per terminal node of the prototype
+struct RecordsBuffers {
+    std::deque<std::vector<int64_t>> integers;
+    std::deque<std::vector<float>> floats;
+    std::deque<std::vector<double>> doubles;
+    std::deque<std::vector<ustring>> strings;
+    std::vector<SourceDestBuffer> dbufs;
+    std::vector<SourceDestBuffer> sbufs;
+
+    void add(const Node &node, const std::string &path, ImageFile &source, ImageFile &dest, size_t capacity) {
+        NodeType type = node.type();
+        if (type == NodeType::E57_STRUCTURE || type == NodeType::E57_VECTOR) {
+            int64_t count = (type == NodeType::E57_STRUCTURE) ? StructureNode(node).childCount() : VectorNode(node).childCount();
+            for (int64_t i = 0; i < count; ++i) {
+                Node child = (type == NodeType::E57_STRUCTURE) ? StructureNode(node).get(i) : VectorNode(node).get(i);
+                add(child, path.empty() ? child.elementName() : path + "/" + child.elementName(), source, dest, capacity);
+            }
+        } else if (type == NodeType::E57_INTEGER || type == NodeType::E57_SCALED_INTEGER) {
+            // scaled integers are copied as raw values, so they are exactly the same
+            integers.emplace_back(capacity);
+            dbufs.emplace_back(source, path, integers.back().data(), capacity, false, false);
+            sbufs.emplace_back(dest, path, integers.back().data(), capacity, false, false);
+        } else if (type == NodeType::E57_FLOAT && FloatNode(node).precision() == E57_SINGLE) {
+            floats.emplace_back(capacity);
+            dbufs.emplace_back(source, path, floats.back().data(), capacity, false, false);
+            sbufs.emplace_back(dest, path, floats.back().data(), capacity, false, false);
+        } else if (type == NodeType::E57_FLOAT) {
+            doubles.emplace_back(capacity);
+            dbufs.emplace_back(source, path, doubles.back().data(), capacity, false, false);
+            sbufs.emplace_back(dest, path, doubles.back().data(), capacity, false, false);
+        } else if (type == NodeType::E57_STRING) {
+            strings.emplace_back(capacity);
+            dbufs.emplace_back(source, path, &strings.back());
+            sbufs.emplace_back(dest, path, &strings.back());
+        } else {
+            throw std::runtime_error("Unsupported node type in prototype: " + path);
+        }
+    }
+};
+
+void copy_compressed_vector_data(CompressedVectorNode &in, CompressedVectorNode &out, size_t chunk_size) {
+    if (chunk_size == 0)
+        throw py::value_error("The chunk size must be at least 1");
+    ImageFile source = in.destImageFile();
+    ImageFile dest = out.destImageFile();
+    RecordsBuffers buffers;
+    buffers.add(in.prototype(), "", source, dest, chunk_size);
+
+    CompressedVectorReader reader = in.reader(buffers.dbufs);
+    CompressedVectorWriter writer = out.writer(buffers.sbufs);
+    unsigned count;
+    while ((count = reader.read()) > 0) {
+        writer.write(count);
+    }
+    reader.close();
+    writer.close();
+}
+
+void copy_blob_data(BlobNode &in, BlobNode &out, size_t chunk_size) {
+    if (chunk_size == 0)
+        throw py::value_error("The chunk size must be at least 1");
+    int64_t byte_count = in.byteCount();
+    std::vector<uint8_t> buffer(static_cast<size_t>(std::min<int64_t>(byte_count, chunk_size)));
+    for (int64_t start = 0; start < byte_count; start += chunk_size) {
+        size_t count = static_cast<size_t>(std::min<int64_t>(byte_count - start, chunk_size));
+        in.read(buffer.data(), start, count);
+        out.write(buffer.data(), start, count);
+    }
+}
+
 PYBIND11_MODULE(libe57, m) {
     m.doc() = "E57 reader/writer for python.";
 
@@ -291,6 +436,10 @@ PYBIND11_MODULE(libe57, m) {
             new (&s) SourceDestBuffer(imf, pathName, static_cast<int16_t *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(int16_t) : stride);
         else if (dtype == "H" || dtype == "=H")
             new (&s) SourceDestBuffer(imf, pathName, static_cast<uint16_t *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(uint16_t) : stride);
+        else if (dtype == "i" || dtype == "=i")
+            new (&s) SourceDestBuffer(imf, pathName, static_cast<int32_t *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(int32_t) : stride);
+        else if (dtype == "I" || dtype == "=I")
+            new (&s) SourceDestBuffer(imf, pathName, static_cast<uint32_t *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(uint32_t) : stride);
         else if (dtype == "l" || dtype == "=l")
             new (&s) SourceDestBuffer(imf, pathName, static_cast<int32_t *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(int32_t) : stride);
         else if (dtype == "L" || dtype == "=L")
@@ -304,7 +453,7 @@ PYBIND11_MODULE(libe57, m) {
         else if (dtype == "d" || dtype == "=d")
             new (&s) SourceDestBuffer(imf, pathName, static_cast<double *>(info.ptr), capacity, doConversion, doScaling, (stride == 0) ? sizeof(double) : stride);
         else
-            throw py::value_error("Incompatible type (integers: bBhHlLq, bool: ?, floats: fd), got: " + dtype);
+            throw py::value_error("Incompatible type (integers: bBhHiIlLq, bool: ?, floats: fd), got: " + dtype);
     },
     "destImageFile"_a, "pathName"_a, "b"_a, "capacity"_a, "doConversion"_a=false, "doScaling"_a=false, "stride"_a=0);
 //    cls_SourceDestBuffer.def(py::init<e57::ImageFile, const std::string, int8_t *, const size_t, bool, bool, size_t>(), "destImageFile"_a, "pathName"_a, "b"_a, "capacity"_a, "doConversion"_a=false, "doScaling"_a=false, "stride"_a=sizeof(int8_t));
@@ -328,9 +477,12 @@ PYBIND11_MODULE(libe57, m) {
         return "<SourceDestBuffer '" + bf.pathName() + "'>";
     });
 
+    // The GIL is released while decoding or encoding data, so separate ImageFile objects
+    // can be used from separate threads at the same time. A single ImageFile, and the
+    // readers, writers and nodes that belong to it, must only be used by one thread at a time.
     py::class_<CompressedVectorReader> cls_CompressedVectorReader(m, "CompressedVectorReader");
-    cls_CompressedVectorReader.def("read", (unsigned (CompressedVectorReader::*)(void)) &CompressedVectorReader::read);
-    cls_CompressedVectorReader.def("read", (unsigned (CompressedVectorReader::*)(std::vector<SourceDestBuffer> &)) &CompressedVectorReader::read, "dbufs"_a);
+    cls_CompressedVectorReader.def("read", (unsigned (CompressedVectorReader::*)(void)) &CompressedVectorReader::read, py::call_guard<py::gil_scoped_release>());
+    cls_CompressedVectorReader.def("read", (unsigned (CompressedVectorReader::*)(std::vector<SourceDestBuffer> &)) &CompressedVectorReader::read, "dbufs"_a, py::call_guard<py::gil_scoped_release>());
     cls_CompressedVectorReader.def("seek", &CompressedVectorReader::seek, "recordNumber"_a);
     cls_CompressedVectorReader.def("close", &CompressedVectorReader::close);
     cls_CompressedVectorReader.def("isOpen", &CompressedVectorReader::isOpen);
@@ -339,9 +491,9 @@ PYBIND11_MODULE(libe57, m) {
     cls_CompressedVectorReader.def("__del__", [](CompressedVectorReader &r) { r.close(); });
 
     py::class_<CompressedVectorWriter> cls_CompressedVectorWriter(m, "CompressedVectorWriter");
-    cls_CompressedVectorWriter.def("write", (void (CompressedVectorWriter::*)(const size_t)) &CompressedVectorWriter::write, "requestedRecordCount"_a);
-    cls_CompressedVectorWriter.def("write", (void (CompressedVectorWriter::*)(std::vector<SourceDestBuffer> &, const size_t)) &CompressedVectorWriter::write, "sbufs"_a, "requestedRecordCount"_a);
-    cls_CompressedVectorWriter.def("close", &CompressedVectorWriter::close);
+    cls_CompressedVectorWriter.def("write", (void (CompressedVectorWriter::*)(const size_t)) &CompressedVectorWriter::write, "requestedRecordCount"_a, py::call_guard<py::gil_scoped_release>());
+    cls_CompressedVectorWriter.def("write", (void (CompressedVectorWriter::*)(std::vector<SourceDestBuffer> &, const size_t)) &CompressedVectorWriter::write, "sbufs"_a, "requestedRecordCount"_a, py::call_guard<py::gil_scoped_release>());
+    cls_CompressedVectorWriter.def("close", &CompressedVectorWriter::close, py::call_guard<py::gil_scoped_release>());
     cls_CompressedVectorWriter.def("isOpen", &CompressedVectorWriter::isOpen);
     cls_CompressedVectorWriter.def("compressedVectorNode", &CompressedVectorWriter::compressedVectorNode);
     cls_CompressedVectorWriter.def("checkInvariant", &CompressedVectorWriter::checkInvariant, "doRecurse"_a=true);
@@ -462,6 +614,7 @@ PYBIND11_MODULE(libe57, m) {
             throw std::runtime_error("Buffer not large enough to read.");
         }
 
+        py::gil_scoped_release release;
         node.read(reinterpret_cast<uint8_t*>(info.ptr), start, count);
     });
     cls_BlobNode.def("write", [](BlobNode& node, py::buffer buf, int64_t start, size_t count) {
@@ -479,6 +632,7 @@ PYBIND11_MODULE(libe57, m) {
             throw std::runtime_error("Buffer not large enough to write.");
         }
 
+        py::gil_scoped_release release;
         node.write(reinterpret_cast<uint8_t*>(info.ptr), start, count);
     });
     cls_BlobNode.def(py::init<const e57::Node &>(), "n"_a);
@@ -495,7 +649,11 @@ PYBIND11_MODULE(libe57, m) {
     cls_BlobNode.def("read_buffer", [](BlobNode &node) -> py::array {
         int64_t bufferSizeExpected = node.byteCount();
         py::array_t<uint8_t> arr(bufferSizeExpected);
-        node.read(arr.mutable_data(), 0, bufferSizeExpected);
+        uint8_t *data = arr.mutable_data();
+        {
+            py::gil_scoped_release release;
+            node.read(data, 0, bufferSizeExpected);
+        }
         return arr;
     });
 
@@ -538,5 +696,31 @@ PYBIND11_MODULE(libe57, m) {
 //    cls_E57Utilities.def("getVersions", &E57Utilities::getVersions, "astmMajor"_a, "astmMinor"_a, "libraryId"_a);
 //    cls_E57Utilities.def("errorCodeToString", &E57Utilities::errorCodeToString, "ecode"_a);
 
+    // Copying is done without going through python objects, the GIL is released while copying the data.
+    m.def("copy_node", [](py::handle node, ImageFile &dest) {
+        CompressedVectorPairs compressed_vectors;
+        BlobPairs blobs;
+        Node out = copy_node(as_node(node), dest, compressed_vectors, blobs);
+        py::list compressed_vector_pairs;
+        for (auto &pair : compressed_vectors)
+            compressed_vector_pairs.append(py::make_tuple(pair.first, pair.second));
+        py::list blob_pairs;
+        for (auto &pair : blobs)
+            blob_pairs.append(py::make_tuple(pair.first, pair.second));
+        return py::make_tuple(cast_node(out), compressed_vector_pairs, blob_pairs);
+    }, "node"_a, "destImageFile"_a,
+    "Copies a node and its children to another image file. Returns the new node, and the "
+    "(source, destination) pairs of compressed vectors and blobs whose data must still be copied.");
+    m.def("copy_compressed_vector_data", [](CompressedVectorNode &in, CompressedVectorNode &out, size_t chunk_size) {
+        py::gil_scoped_release release;
+        copy_compressed_vector_data(in, out, chunk_size);
+    }, "in_node"_a, "out_node"_a, "chunk_size"_a=100000,
+    "Copies the records of a compressed vector to an empty one with the same prototype.");
+    m.def("copy_blob_data", [](BlobNode &in, BlobNode &out, size_t chunk_size) {
+        py::gil_scoped_release release;
+        copy_blob_data(in, out, chunk_size);
+    }, "in_node"_a, "out_node"_a, "chunk_size"_a=1048576,
+    "Copies the bytes of a blob to another blob of the same size.");
+
     py::bind_vector<std::vector<e57::SourceDestBuffer>>(m, "VectorSourceDestBuffer");
 }
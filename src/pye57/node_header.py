@@ -0,0 +1,61 @@
+from functools import cached_property
+
+import numpy as np
+from pyquaternion import Quaternion
+
+from pye57 import libe57
+
+
+class NodeHeader:
+    """Base class of the headers of scans and images: the memoized values of a node, and its pose."""
+    def __init__(self, node):
+        self.node = node
+        self._values = {}
+
+    def __getitem__(self, item):
+        return self.node[item]
+
+    def _value(self, *path):
+        # memoized value of a child node, failed lookups are not memoized
+        if path not in self._values:
+            node = self.node
+            for name in path:
+                node = node[name]
+            self._values[path] = node.value()
+        return self._values[path]
+
+    def has_pose(self):
+        return self.node.isDefined("pose")
+
+    @cached_property
+    def _quaternion(self):
+        try:
+            rotation = self.node["pose"]["rotation"]
+            q = Quaternion([e.value() for e in rotation])
+        except libe57.E57Exception:
+            q = Quaternion()
+        return q
+
+    @cached_property
+    def _translation(self):
+        try:
+            translation_values = [e.value() for e in self.node["pose"]["translation"]]
+        except libe57.E57Exception:
+            translation_values = [0] * 3
+        return np.array(translation_values)
+
+    @cached_property
+    def _rotation_matrix(self):
+        return self._quaternion.rotation_matrix
+
+    @property
+    def rotation_matrix(self) -> np.array:
+        return self._rotation_matrix.copy()
+
+    @property
+    def rotation(self) -> np.array:
+        return self._quaternion.elements.copy()
+
+    @property
+    def translation(self):
+        return self._translation.copy()
@@ -1,56 +1,41 @@
+from functools import cached_property
+
 import numpy as np
 from pyquaternion import Quaternion
 
 from pye57 import libe57
+from pye57.node_header import NodeHeader
 from pye57.utils import get_fields, get_node
 
-class ScanHeader:
+class ScanHeader(NodeHeader):
     """Provides summary statistics for an individual lidar scan in an E57 file.
 
     Including the number of points, bounds and pose of the scan.
+    Values read from the file are memoized, use `snapshot` to get a lightweight copy.
     """
-    def __init__(self, scan_node):
-        self.node = scan_node
-        points = self.node["points"]
-        self.point_fields = get_fields(libe57.StructureNode(points.prototype()))
-        self.scan_fields = get_fields(self.node)
-
     @classmethod
     def from_data3d(cls, data3d):
         return [cls(scan) for scan in data3d]
 
-    def has_pose(self):
-        return self.node.isDefined("pose")
+    @cached_property
+    def prototype(self):
+        return libe57.StructureNode(self.points.prototype())
 
-    @property
-    def point_count(self):
-        return self.points.childCount()
+    @cached_property
+    def point_fields(self):
+        return get_fields(self.prototype)
 
-    @property
-    def rotation_matrix(self) -> np.array:
-        try:
-            rotation = self.node["pose"]["rotation"]
-            q = Quaternion([e.value() for e in rotation])
-        except libe57.E57Exception:
-            q = Quaternion()
-        return q.rotation_matrix
+    @cached_property
+    def scan_fields(self):
+        return get_fields(self.node)
 
     @property
-    def rotation(self) -> np.array:
-        try:
-            rotation = self.node["pose"]["rotation"]
-            q = Quaternion([e.value() for e in rotation])
-        except libe57.E57Exception:
-            q = Quaternion()
-        return q.elements
+    def point_count(self):
+        return self.points.childCount()
 
-    @property
-    def translation(self):
-        try:
-            translation_values = [e.value() for e in self.node["pose"]["translation"]]
-        except libe57.E57Exception:
-            translation_values = [0] * 3
-        return np.array(translation_values)
+    def snapshot(self):
+        """Copies the header information to a `ScanHeaderSnapshot` made of plain python values."""
+        return ScanHeaderSnapshot(self)
 
     def pretty_print(self, node=None, indent=""):
         if node is None:
@@ -66,9 +51,6 @@ class ScanHeader:
                 lines += self.pretty_print(child_node, indent + "    ")
         return lines
 
-    def __getitem__(self, item):
-        return self.node[item]
-    
     def get_coordinate_system(self, COORDINATE_SYSTEMS):
         if all(x in self.point_fields for x in COORDINATE_SYSTEMS.CARTESIAN.value):
             coordinate_system = COORDINATE_SYSTEMS.CARTESIAN
@@ -80,19 +62,19 @@ class ScanHeader:
 
     @property
     def guid(self):
-        return self["guid"].value()
+        return self._value("guid")
 
     @property
     def temperature(self):
-        return self["temperature"].value()
+        return self._value("temperature")
 
     @property
     def relativeHumidity(self):
-        return self["relativeHumidity"].value()
+        return self._value("relativeHumidity")
 
     @property
     def atmosphericPressure(self):
-        return self["atmosphericPressure"].value()
+        return self._value("atmosphericPressure")
 
     @property
     def indexBounds(self):
@@ -100,27 +82,27 @@ class ScanHeader:
 
     @property
     def rowMinimum(self):
-        return self.indexBounds["rowMinimum"].value()
+        return self._value("indexBounds", "rowMinimum")
 
     @property
     def rowMaximum(self):
-        return self.indexBounds["rowMaximum"].value()
+        return self._value("indexBounds", "rowMaximum")
 
     @property
     def columnMinimum(self):
-        return self.indexBounds["columnMinimum"].value()
+        return self._value("indexBounds", "columnMinimum")
 
     @property
     def columnMaximum(self):
-        return self.indexBounds["columnMaximum"].value()
+        return self._value("indexBounds", "columnMaximum")
 
     @property
     def returnMinimum(self):
-        return self.indexBounds["returnMinimum"].value()
+        return self._value("indexBounds", "returnMinimum")
 
     @property
     def returnMaximum(self):
-        return self.indexBounds["returnMaximum"].value()
+        return self._value("indexBounds", "returnMaximum")
 
     @property
     def intensityLimits(self):
@@ -128,11 +110,11 @@ class ScanHeader:
 
     @property
     def intensityMinimum(self):
-        return self.intensityLimits["intensityMinimum"].value()
+        return self._value("intensityLimits", "intensityMinimum")
 
     @property
     def intensityMaximum(self):
-        return self.intensityLimits["intensityMaximum"].value()
+        return self._value("intensityLimits", "intensityMaximum")
 
     @property
     def cartesianBounds(self):
@@ -140,27 +122,27 @@ class ScanHeader:
 
     @property
     def xMinimum(self):
-        return self.cartesianBounds["xMinimum"].value()
+        return self._value("cartesianBounds", "xMinimum")
 
     @property
     def xMaximum(self):
-        return self.cartesianBounds["xMaximum"].value()
+        return self._value("cartesianBounds", "xMaximum")
 
     @property
     def yMinimum(self):
-        return self.cartesianBounds["yMinimum"].value()
+        return self._value("cartesianBounds", "yMinimum")
 
     @property
     def yMaximum(self):
-        return self.cartesianBounds["yMaximum"].value()
+        return self._value("cartesianBounds", "yMaximum")
 
     @property
     def zMinimum(self):
-        return self.cartesianBounds["zMinimum"].value()
+        return self._value("cartesianBounds", "zMinimum")
 
     @property
     def zMaximum(self):
-        return self.cartesianBounds["zMaximum"].value()
+        return self._value("cartesianBounds", "zMaximum")
 
     @property
     def sphericalBounds(self):
@@ -168,27 +150,27 @@ class ScanHeader:
 
     @property
     def rangeMinimum(self):
-        return self.sphericalBounds["rangeMinimum"].value()
+        return self._value("sphericalBounds", "rangeMinimum")
 
     @property
     def rangeMaximum(self):
-        return self.sphericalBounds["rangeMaximum"].value()
+        return self._value("sphericalBounds", "rangeMaximum")
 
     @property
     def elevationMinimum(self):
-        return self.sphericalBounds["elevationMinimum"].value()
+        return self._value("sphericalBounds", "elevationMinimum")
     
     @property
     def elevationMaximum(self):
-        return self.sphericalBounds["elevationMaximum"].value()
+        return self._value("sphericalBounds", "elevationMaximum")
     
     @property
     def azimuthStart(self):
-        return self.sphericalBounds["azimuthStart"].value()
+        return self._value("sphericalBounds", "azimuthStart")
     
     @property
     def azimuthEnd(self):
-        return self.sphericalBounds["azimuthEnd"].value()
+        return self._value("sphericalBounds", "azimuthEnd")
     
     @property
     def pose(self):
@@ -200,11 +182,11 @@ class ScanHeader:
 
     @property
     def acquisitionStart_dateTimeValue(self):
-        return self.acquisitionStart["dateTimeValue"].value()
+        return self._value("acquisitionStart", "dateTimeValue")
 
     @property
     def acquisitionStart_isAtomicClockReferenced(self):
-        return self.acquisitionStart["isAtomicClockReferenced"].value()
+        return self._value("acquisitionStart", "isAtomicClockReferenced")
 
     @property
     def acquisitionEnd(self):
@@ -212,16 +194,97 @@ class ScanHeader:
 
     @property
     def acquisitionEnd_dateTimeValue(self):
-        return self.acquisitionEnd["dateTimeValue"].value()
+        return self._value("acquisitionEnd", "dateTimeValue")
 
     @property
     def acquisitionEnd_isAtomicClockReferenced(self):
-        return self.acquisitionEnd["isAtomicClockReferenced"].value()
+        return self._value("acquisitionEnd", "isAtomicClockReferenced")
 
     @property
     def pointGroupingSchemes(self):
         return self["pointGroupingSchemes"]
 
-    @property
+    @cached_property
     def points(self):
         return self["points"]
+
+
+class ScanHeaderSnapshot:
+    """Copy of the information of a `ScanHeader`, made of plain python values.
+
+    It doesn't reference the E57 file anymore, so it's cheap to keep around and to send
+    to other processes. It can also be passed as `scan_header` to `E57.write_scan_raw`.
+    Attributes for values that are absent from the file are left unset.
+    """
+    __slots__ = (
+        "guid",
+        "name",
+        "temperature",
+        "relativeHumidity",
+        "atmosphericPressure",
+        "point_count",
+        "point_fields",
+        "_has_pose",
+        "_rotation",
+        "_translation",
+        "rowMinimum",
+        "rowMaximum",
+        "columnMinimum",
+        "columnMaximum",
+        "returnMinimum",
+        "returnMaximum",
+        "intensityMinimum",
+        "intensityMaximum",
+        "xMinimum",
+        "xMaximum",
+        "yMinimum",
+        "yMaximum",
+        "zMinimum",
+        "zMaximum",
+        "rangeMinimum",
+        "rangeMaximum",
+        "elevationMinimum",
+        "elevationMaximum",
+        "azimuthStart",
+        "azimuthEnd",
+        "acquisitionStart_dateTimeValue",
+        "acquisitionStart_isAtomicClockReferenced",
+        "acquisitionEnd_dateTimeValue",
+        "acquisitionEnd_isAtomicClockReferenced",
+    )
+
+    def __init__(self, header: ScanHeader):
+        for attribute in self.__slots__:
+            if attribute.startswith("_"):
+                continue
+            try:
+                if attribute == "name":
+                    value = header["name"].value()
+                else:
+                    value = getattr(header, attribute)
+            except libe57.E57Exception:
+                continue
+            if isinstance(value, list):
+                value = tuple(value)
+            setattr(self, attribute, value)
+        self._has_pose = header.has_pose()
+        self._rotation = tuple(header.rotation.tolist())
+        self._translation = tuple(header.translation.tolist())
+
+    def has_pose(self):
+        return self._has_pose
+
+    @property
+    def rotation(self) -> np.array:
+        return np.array(self._rotation)
+
+    @property
+    def rotation_matrix(self) -> np.array:
+        return Quaternion(self._rotation).rotation_matrix
+
+    @property
+    def translation(self):
+        return np.array(self._translation)
+
+    def __repr__(self):
+        return "<ScanHeaderSnapshot '%s'>" % getattr(self, "name", getattr(self, "guid", ""))
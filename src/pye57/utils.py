@@ -1,7 +1,13 @@
+import os
+
 from pye57 import libe57
 from pye57.libe57 import NodeType
 
 import numpy as np
+from pyquaternion import Quaternion
+
+# number of points processed at once by the conversions, small enough to keep the temporary arrays in cache
+DEFAULT_BLOCK_SIZE = 65536
 
 def get_fields(node):
     return [node.get(id_).elementName() for id_ in range(node.childCount())]
@@ -21,23 +27,190 @@ def get_node(node, name):
     n = node.get(name)
     return cast[n.type()](n)
 
-def convert_spherical_to_cartesian(rae):
+
+# integer types that SourceDestBuffer accepts on all platforms, from the narrowest
+INTEGER_DTYPES = [np.dtype(c) for c in "bBhHiq"]
+
+
+def field_dtype(node, preferred=None, scaled=True) -> np.dtype:
+    """Returns the narrowest numpy type that holds the values of a prototype field without loss.
+
+    Scaled integers are returned scaled, as float64, or as their raw integer values if `scaled`
+    is False. If the `preferred` type can hold the values of the field, it is returned instead:
+    a float type holds scaled integers when it tells apart the values one scale step away.
+    """
+    node_type = node.type()
+    if node_type == NodeType.E57_SCALED_INTEGER and not scaled:
+        node = libe57.ScaledIntegerNode(node)
+        node_type = NodeType.E57_INTEGER
+    if node_type == NodeType.E57_FLOAT:
+        node = libe57.FloatNode(node)
+        single = node.precision() == libe57.E57_SINGLE
+        candidates = [np.dtype("f" if single else "d")]
+        if preferred is not None:
+            preferred = np.dtype(preferred)
+            if preferred.kind == "f" and preferred.itemsize >= candidates[0].itemsize:
+                return preferred
+    elif node_type == NodeType.E57_INTEGER:
+        if not isinstance(node, libe57.ScaledIntegerNode):
+            node = libe57.IntegerNode(node)
+        minimum, maximum = node.minimum(), node.maximum()
+        candidates = [dtype for dtype in INTEGER_DTYPES
+                      if np.iinfo(dtype).min <= minimum and maximum <= np.iinfo(dtype).max]
+        if preferred is not None:
+            preferred = np.dtype(preferred)
+            if preferred.kind == "f":
+                # integers are exact up to the size of the mantissa
+                largest = 2 ** (np.finfo(preferred).nmant + 1)
+                if -largest <= minimum and maximum <= largest:
+                    return preferred
+            elif preferred in candidates:
+                return preferred
+    elif node_type == NodeType.E57_SCALED_INTEGER:
+        node = libe57.ScaledIntegerNode(node)
+        candidates = [np.dtype("d")]
+        if preferred is not None:
+            preferred = np.dtype(preferred)
+            # a float type holds the scaled values if its spacing over their range is below the scale
+            largest = max(abs(node.scaledMinimum()), abs(node.scaledMaximum()))
+            if preferred.kind == "f" and largest * np.finfo(preferred).eps <= abs(node.scale()):
+                return preferred
+    else:
+        raise ValueError("Unsupported point field type: %s" % node.elementName())
+    return candidates[0]
+
+def convert_spherical_to_cartesian(rae, out=None, *, rotation_matrix=None, translation=None, block_size=DEFAULT_BLOCK_SIZE):
     """
     Converts spherical(rae) to cartesian(xyz), where rae = range, azimuth(theta), 
     elevation(phi). Where range is in meters and angles are in radians.
     
     Reference for formula: http://www.libe57.org/bestCoordinates.html (Note: the 
     formula is different from the one online, so please use formula at the above reference)
+
+    The points are converted in blocks of `block_size` rows, so that the temporary arrays stay small.
+    The result is written to `out`, a (N, 3) array that can be `rae` itself. By default, a new array
+    is returned, in float32 if `rae` is float32 and no pose is applied, and in float64 otherwise.
+    A rotation matrix and a translation (e.g. the pose of the scan) can be applied in the same pass,
+    see `filter_and_transform`, which does the conversion.
     """
-    range_ = rae[:, :1]
-    theta = rae[:, 1:2]
-    phi =  rae[:, 2:3]
-    range_cos_phi = range_ * np.cos(phi)
-    return np.concatenate((
-        range_cos_phi * np.cos(theta),
-        range_cos_phi * np.sin(theta),
-        range_ * np.sin(phi)
-    ), axis=1)
+    n_points = rae.shape[0]
+    if out is None:
+        single = rae.dtype == np.float32 and rotation_matrix is None and translation is None
+        out = np.empty((n_points, 3), np.float32 if single else np.float64)
+    elif out.ndim != 2 or out.shape[0] != n_points or out.shape[1] != 3:
+        raise ValueError("'out' must be an array of shape (%s, 3)" % n_points)
+    # the columns of 'rae' are read block by block before the same block of 'out' is written
+    filter_and_transform([rae[:, 0], rae[:, 1], rae[:, 2]],
+                         spherical=True,
+                         rotation_matrix=rotation_matrix,
+                         translation=translation,
+                         out=[out[:, 0], out[:, 1], out[:, 2]],
+                         block_size=block_size)
+    return out
+
+
+def transformed_dtype(dtypes, posed=False) -> np.dtype:
+    """Returns the type of the coordinates computed from coordinates of the given types by filter_and_transform."""
+    # float32 coordinates are kept relative to the scan origin: a pose, e.g. a georeferenced
+    # translation, is applied in float64 to keep the precision of the result
+    single = all(dtype == np.float32 for dtype in dtypes) and not posed
+    return np.dtype(np.float32 if single else np.float64)
+
+
+def filter_and_transform(coordinates,
+                         fields=(),
+                         valid=None,
+                         *,
+                         spherical=False,
+                         rotation_matrix=None,
+                         translation=None,
+                         out=None,
+                         block_size=DEFAULT_BLOCK_SIZE):
+    """Filters and transforms points in a single pass, one block of `block_size` points at a time.
+
+    `coordinates` are the x, y and z arrays (or range, azimuth and elevation if `spherical` is set),
+    and `fields` are other point arrays that are only filtered. The points where `valid` is False
+    are removed, spherical coordinates are converted to cartesian, then the rotation and
+    the translation are applied. The coordinates are computed in float32 when they are all float32
+    and no rotation or translation is applied, and in float64 otherwise.
+
+    The results are written to `out`, a list with one array per coordinate and field.
+    New arrays sized by the number of valid points are allocated for the ones that are None,
+    or for all of them if `out` isn't given. The input arrays can also be used as outputs:
+    the valid points are then compacted at their beginning.
+    Returns the lists of coordinates and fields, sized by the number of valid points.
+    """
+    n_points = coordinates[0].shape[0]
+    n_valid = n_points if valid is None else np.count_nonzero(valid)
+    posed = rotation_matrix is not None or translation is not None
+    dtype = transformed_dtype([c.dtype for c in coordinates], posed)
+    inputs = list(coordinates) + list(fields)
+    out = [None] * len(inputs) if out is None else list(out)
+    if len(out) != len(inputs) or any(o is not None and o.shape[0] < n_valid for o in out):
+        raise ValueError("'out' must have one array of at least %s points per coordinate and field" % n_valid)
+    transform = spherical or rotation_matrix is not None or translation is not None
+    for i, array in enumerate(out):
+        if array is None:
+            # coordinates that are only filtered keep their type, e.g. raw integers
+            out[i] = np.empty(n_valid, dtype if i < len(coordinates) and transform else inputs[i].dtype)
+    if rotation_matrix is not None:
+        rotation_matrix = np.asarray(rotation_matrix, dtype=dtype)
+    if translation is not None:
+        translation = np.asarray(translation, dtype=dtype).reshape(3)
+
+    block_size = max(1, min(block_size, n_points))
+    if transform:
+        # x, y, z, and the intermediate values of the spherical conversion
+        temp = np.empty((5, block_size), dtype)
+    position = 0
+    for start in range(0, n_points, block_size):
+        stop = min(start + block_size, n_points)
+        mask = None if valid is None else valid[start:stop]
+        count = stop - start if mask is None else np.count_nonzero(mask)
+        # everything is read from a block before writing, and the output position is never after
+        # the input position, so the input arrays can be used as outputs
+        if transform:
+            xyz = temp[:3, :count]
+            for i, coordinate in enumerate(coordinates):
+                if mask is None:
+                    xyz[i] = coordinate[start:stop]
+                elif coordinate.dtype == dtype:
+                    np.compress(mask, coordinate[start:stop], out=xyz[i])
+                else:
+                    # float32 coordinates of a scan with a pose
+                    xyz[i] = np.compress(mask, coordinate[start:stop])
+            if spherical:
+                range_, theta, phi = xyz
+                cos_theta, range_cos_phi = temp[3, :count], temp[4, :count]
+                np.cos(theta, out=cos_theta)
+                np.cos(phi, out=range_cos_phi)
+                np.multiply(range_, range_cos_phi, out=range_cos_phi)
+                # x, y and z replace range, azimuth and elevation
+                np.sin(theta, out=theta)
+                np.multiply(range_cos_phi, theta, out=theta)
+                np.sin(phi, out=phi)
+                np.multiply(range_, phi, out=phi)
+                np.multiply(range_cos_phi, cos_theta, out=range_)
+            if rotation_matrix is not None:
+                xyz = np.dot(rotation_matrix, xyz)
+            for i in range(3):
+                if translation is not None:
+                    np.add(xyz[i], translation[i], out=out[i][position:position + count])
+                else:
+                    out[i][position:position + count] = xyz[i]
+            copied = range(3, len(inputs))
+        else:
+            copied = range(len(inputs))
+        for i in copied:
+            if mask is None:
+                if out[i] is not inputs[i]:
+                    out[i][position:position + count] = inputs[i][start:stop]
+            else:
+                out[i][position:position + count] = np.compress(mask, inputs[i][start:stop])
+        position += count
+
+    out = [o[:n_valid] for o in out]
+    return out[:len(coordinates)], out[len(coordinates):]
 
 
 def copy_node(node, dest_image):
@@ -114,4 +287,94 @@ def copy_node(node, dest_image):
             compressed_node_pairs.extend(out_child_compressed_node_pairs)
             blob_node_pairs.extend(out_child_blob_node_pairs)
 
-    return out_node, compressed_node_pairs, blob_node_pairs
\ No newline at end of file
+    return out_node, compressed_node_pairs, blob_node_pairs
+
+def clone(src, dst, scans=None, transform=None):
+    """Copies an E57 file, optionally keeping only some of its scans and moving them.
+
+    The tree and the binary data of the file are copied by native code, without decoding
+    the points to numpy arrays, so the points are copied exactly (scaled integers as raw values).
+    `scans` are the indices of the scans to keep, in the order they are written.
+    `transform` is a (rotation, translation) pair, the rotation being a [w, x, y, z] quaternion,
+    which is applied after the pose of each copied scan.
+    """
+    in_image = libe57.ImageFile(os.fspath(src), "r")
+    try:
+        out_image = libe57.ImageFile(os.fspath(dst), "w")
+    except Exception:
+        in_image.close()
+        raise
+    try:
+        for i in range(in_image.extensionsCount()):
+            out_image.extensionsAdd(in_image.extensionsPrefix(i), in_image.extensionsUri(i))
+
+        in_root = in_image.root()
+        out_root = out_image.root()
+        compressed_vector_pairs = []
+        blob_pairs = []
+        for i in range(in_root.childCount()):
+            in_child = in_root.get(i)
+            name = in_child.elementName()
+            if name == "data3D" and (scans is not None or transform is not None):
+                in_child = libe57.VectorNode(in_child)
+                out_child = libe57.VectorNode(out_image, in_child.allowHeteroChildren())
+                indices = range(in_child.childCount()) if scans is None else scans
+                for index in indices:
+                    in_scan = libe57.StructureNode(in_child.get(index))
+                    out_child.append(_clone_scan(in_scan, out_image, transform, compressed_vector_pairs, blob_pairs))
+            else:
+                out_child, child_compressed_vector_pairs, child_blob_pairs = libe57.copy_node(in_child, out_image)
+                compressed_vector_pairs.extend(child_compressed_vector_pairs)
+                blob_pairs.extend(child_blob_pairs)
+            out_root.set(name, out_child)
+
+        # the data can only be written once the whole tree is created
+        for in_node, out_node in compressed_vector_pairs:
+            libe57.copy_compressed_vector_data(in_node, out_node)
+        for in_node, out_node in blob_pairs:
+            libe57.copy_blob_data(in_node, out_node)
+    except Exception:
+        in_image.close()
+        out_image.cancel()
+        raise
+    in_image.close()
+    out_image.close()
+
+
+def _clone_scan(in_scan, out_image, transform, compressed_vector_pairs, blob_pairs):
+    out_scan = libe57.StructureNode(out_image)
+    for i in range(in_scan.childCount()):
+        in_child = in_scan.get(i)
+        name = in_child.elementName()
+        if name == "pose" and transform is not None:
+            continue
+        out_child, child_compressed_vector_pairs, child_blob_pairs = libe57.copy_node(in_child, out_image)
+        compressed_vector_pairs.extend(child_compressed_vector_pairs)
+        blob_pairs.extend(child_blob_pairs)
+        out_scan.set(name, out_child)
+
+    if transform is not None:
+        rotation, translation = Quaternion(1, 0, 0, 0), np.zeros(3)
+        if in_scan.isDefined("pose"):
+            pose = libe57.StructureNode(in_scan.get("pose"))
+            if pose.isDefined("rotation"):
+                rotation = Quaternion([get_node(libe57.StructureNode(pose.get("rotation")), axis).value()
+                                       for axis in "wxyz"])
+            if pose.isDefined("translation"):
+                translation = np.array([get_node(libe57.StructureNode(pose.get("translation")), axis).value()
+                                        for axis in "xyz"])
+        transform_rotation = Quaternion(transform[0])
+        rotation = transform_rotation * rotation
+        translation = transform_rotation.rotate(translation) + np.asarray(transform[1], dtype="d")
+
+        pose_node = libe57.StructureNode(out_image)
+        rotation_node = libe57.StructureNode(out_image)
+        for axis, value in zip("wxyz", rotation.elements):
+            rotation_node.set(axis, libe57.FloatNode(out_image, float(value)))
+        pose_node.set("rotation", rotation_node)
+        translation_node = libe57.StructureNode(out_image)
+        for axis, value in zip("xyz", translation):
+            translation_node.set(axis, libe57.FloatNode(out_image, float(value)))
+        pose_node.set("translation", translation_node)
+        out_scan.set("pose", pose_node)
+    return out_scan
@@ -1,12 +1,15 @@
 import pytest
+import asyncio
+import json
 import os
 import time
 
 import numpy as np
+from pyquaternion import Quaternion
 
 import pye57
 from pye57 import libe57
-from pye57.utils import get_node, copy_node
+from pye57.utils import get_node, copy_node, field_dtype
 
 try:
     from exceptions import WindowsError
@@ -170,17 +173,117 @@ def test_unsupported_point_field(temp_e57_write):
             f.write_scan_raw(data)
 
 
-def test_ignore_unsupported_fields(e57_with_normals_path):
+def test_read_any_point_field(e57_with_normals_path):
     e57 = pye57.E57(e57_with_normals_path)
+    header = e57.get_header(0)
+    data = e57.read_scan_raw(0)
+    assert list(data) == header.point_fields
+    # the normals are stored in single precision, the coordinates are kept in float64
+    assert data["nor:normalX"].dtype == np.float32
+    assert data["cartesianX"].dtype == np.float64
+    assert np.all(np.abs(data["nor:normalX"]) <= 1)
+
+    projected = e57.read_scan_raw(0, fields=["nor:normalZ"])
+    assert list(projected) == ["nor:normalZ"]
+    assert np.array_equal(projected["nor:normalZ"], data["nor:normalZ"])
+    with pytest.raises(ValueError):
+        e57.read_scan_raw(0, fields=["intensity"])
+
+    scan = e57.read_scan(0, fields=["nor:normalX", "nor:normalY", "nor:normalZ"], ignore_missing_fields=True)
+    assert np.allclose(scan["nor:normalY"], data["nor:normalY"])
+
+
+def test_dtype_policy(e57_with_normals_path, e57_with_data_and_images_path):
+    e57 = pye57.E57(e57_with_normals_path)
+    data = e57.read_scan(0, ignore_missing_fields=True)
+    native = e57.read_scan(0, ignore_missing_fields=True, dtype_policy="native")
+    assert data["cartesianX"].dtype == np.float64
+    assert native["cartesianX"].dtype == np.float32
+    assert np.array_equal(native["cartesianX"], data["cartesianX"])
+    with pytest.raises(ValueError):
+        e57.read_scan(0, dtype_policy="float16")
+
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    scaling = e57.point_scaling(0)
+    assert set(scaling) == {"cartesianX", "cartesianY", "cartesianZ", "intensity"}
+    data = e57.read_scan_raw(0)
+    raw = e57.read_scan_raw(0, dtype_policy="raw")
+    assert raw["cartesianX"].dtype == np.int32
+    assert raw["intensity"].dtype == np.int16
+    # the scaled intensities keep the float32 type of SUPPORTED_POINT_FIELDS
+    assert data["intensity"].dtype == np.float32
+    assert raw["colorRed"].dtype == np.uint8
+    scale, offset = scaling["cartesianX"]
+    assert np.allclose(raw["cartesianX"] * scale + offset, data["cartesianX"])
+    with pytest.raises(ValueError):
+        e57.read_scan(0, dtype_policy="raw")
+    valid = e57.read_scan(0, transform=False, dtype_policy="raw")
+    assert valid["cartesianX"].dtype == np.int32
+    assert np.array_equal(valid["cartesianX"], raw["cartesianX"][raw["cartesianInvalidState"] == 0])
+
+
+def test_ignore_unsupported_fields(temp_e57_write):
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        imf = f.image_file
+        scan = libe57.StructureNode(imf)
+        f.data3d.append(scan)
+        scan.set("guid", libe57.StringNode(imf, "{unsupported}"))
+        prototype = libe57.StructureNode(imf)
+        prototype.set("cartesianX", libe57.FloatNode(imf, 0.0))
+        prototype.set("label", libe57.StringNode(imf, ""))
+        scan.set("points", libe57.CompressedVectorNode(imf, prototype, libe57.VectorNode(imf, True)))
+    e57 = pye57.E57(temp_e57_write)
     with pytest.raises(ValueError):
         e57.read_scan_raw(0)
-    e57.read_scan_raw(0, ignore_unsupported_fields=True)
+    data = e57.read_scan_raw(0, ignore_unsupported_fields=True)
+    assert list(data) == ["cartesianX"]
+    assert data["cartesianX"].shape == (0,)
+
+
+def test_dtype_policy_with_pose(e57_path):
+    # the scans of this file are georeferenced, with a translation of about 5e6 m
+    e57 = pye57.E57(e57_path)
+    assert np.abs(e57.get_header(1).translation).max() > 1e6
+    data = e57.read_scan(1)
+    native = e57.read_scan(1, dtype_policy="native")
+    # the pose is applied in float64, float32 would lose about 0.5 m
+    assert native["cartesianX"].dtype == np.float64
+    for field in ["cartesianX", "cartesianY", "cartesianZ"]:
+        assert np.array_equal(native[field], data[field])
+    local = e57.read_scan(1, dtype_policy="native", transform=False)
+    assert local["cartesianX"].dtype == np.float32
+
+
+def test_field_dtype(temp_e57_write):
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        imf = f.image_file
+        prototype = libe57.StructureNode(imf)
+        prototype.set("a", libe57.IntegerNode(imf, 0, 0, 2))
+        prototype.set("b", libe57.IntegerNode(imf, 0, -1, 1000))
+        prototype.set("c", libe57.IntegerNode(imf, 0, 0, 2 ** 40))
+        prototype.set("d", libe57.ScaledIntegerNode(imf, 0, 0, 1000, 0.001, 0))
+        prototype.set("e", libe57.FloatNode(imf, 0, libe57.E57_SINGLE))
+        # float32 can't tell apart values 0.001 away from 1e6
+        prototype.set("f", libe57.ScaledIntegerNode(imf, 0, 0, 1000, 0.001, 1e6))
+        assert field_dtype(prototype.get("a")) == np.int8
+        assert field_dtype(prototype.get("a"), "B") == np.uint8
+        assert field_dtype(prototype.get("a"), "b") == np.int8
+        assert field_dtype(prototype.get("b")) == np.int16
+        assert field_dtype(prototype.get("b"), "B") == np.int16
+        assert field_dtype(prototype.get("b"), "f") == np.float32
+        assert field_dtype(prototype.get("c")) == np.int64
+        assert field_dtype(prototype.get("c"), "f") == np.int64
+        assert field_dtype(prototype.get("d")) == np.float64
+        assert field_dtype(prototype.get("d"), "f") == np.float32
+        assert field_dtype(prototype.get("f"), "f") == np.float64
+        assert field_dtype(prototype.get("e")) == np.float32
+        assert field_dtype(prototype.get("e"), "d") == np.float64
 
 
 def test_source_dest_buffers_raises(e57_path):
     f = libe57.ImageFile(e57_path, "r")
     capacity = 1000
-    data = np.zeros(capacity, "i")
+    data = np.zeros(capacity, "e")
     with pytest.raises(ValueError):
         libe57.SourceDestBuffer(f, "something", data, capacity, True, True)
 
@@ -471,3 +574,708 @@ def test_write_e57_with_rowindex_and_columnindex_omiting_low_values(temp_e57_wri
             assert False
     
     assert os.path.isfile(temp_e57_write)
+
+
+def test_iter_scan(e57_path):
+    e57 = pye57.E57(e57_path)
+    data = e57.read_scan(0, intensity=True, row_column=True)
+    chunks = list(e57.iter_scan(0, chunk_size=100000, intensity=True, row_column=True))
+    assert len(chunks) == 3
+    for field in data:
+        assert np.array_equal(data[field], np.concatenate([chunk[field] for chunk in chunks]))
+
+
+def test_iter_scan_raw(e57_with_data_and_images_path):
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    data = e57.read_scan_raw(0)
+    chunks = list(e57.iter_scan_raw(0, chunk_size=50000))
+    assert [len(chunk["cartesianX"]) for chunk in chunks] == [50000, 50000, 50000, 5201]
+    for field in data:
+        assert np.array_equal(data[field], np.concatenate([chunk[field] for chunk in chunks]))
+    chunks = list(e57.iter_scan_raw(0, chunk_size=50000, fields=["intensity"]))
+    assert list(chunks[0].keys()) == ["intensity"]
+
+
+def test_read_scans_from_threads(e57_path, e57_with_data_and_images_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read(path):
+        with pye57.E57(path) as e57:
+            return e57.read_scan(0, intensity=True)
+
+    paths = [e57_path, e57_with_data_and_images_path] * 2
+    expected = [read(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(read, paths))
+    for data, data_expected in zip(results, expected):
+        for field in data_expected:
+            assert np.array_equal(data[field], data_expected[field])
+
+
+def test_read_scan_xyz(e57_path):
+    e57 = pye57.E57(e57_path)
+    data = e57.read_scan(0)
+    header = e57.get_header(0)
+    out = np.empty((header.point_count + 10, 3))
+    xyz = e57.read_scan_xyz(0, out=out)
+    assert np.shares_memory(xyz, out)
+    assert np.allclose(xyz, np.array([data["cartesianX"], data["cartesianY"], data["cartesianZ"]]).T)
+    with pytest.raises(ValueError):
+        e57.read_scan_xyz(0, out=np.empty((10, 3)))
+
+
+def test_read_scan_xyz_spherical(e57_spherical_path):
+    e57 = pye57.E57(e57_spherical_path)
+    data = e57.read_scan(0)
+    xyz = e57.read_scan_xyz(0)
+    assert np.allclose(xyz, np.array([data["cartesianX"], data["cartesianY"], data["cartesianZ"]]).T)
+
+
+def test_make_buffers_structured_array(e57_path):
+    e57 = pye57.E57(e57_path)
+    header = e57.get_header(0)
+    fields = ["cartesianX", "cartesianY", "cartesianZ", "intensity"]
+    out = np.empty(header.point_count, dtype=[(field, "d") for field in fields])
+    data, buffers = e57.make_buffers(fields, header.point_count, out=out)
+    header.points.reader(buffers).read()
+    raw = e57.read_scan_raw(0)
+    for field in fields:
+        assert np.shares_memory(data[field], out)
+        assert np.allclose(out[field], raw[field])
+
+
+def test_read_scans(e57_path):
+    e57 = pye57.E57(e57_path)
+    expected = [e57.read_scan(index, intensity=True) for index in range(e57.scan_count)]
+    scans = e57.read_scans(workers=2, intensity=True)
+    assert len(scans) == e57.scan_count
+    for data, data_expected in zip(scans, expected):
+        assert data.keys() == data_expected.keys()
+        for field in data_expected:
+            assert np.array_equal(data[field], data_expected[field])
+    # the arrays are views of the shared memory the scans were decoded into
+    assert not scans[0]["cartesianX"].flags.owndata
+    decimated = e57.read_scans([0, 1], workers=2, decimate=pye57.Stride(3))
+    assert np.array_equal(decimated[0]["cartesianX"], expected[0]["cartesianX"][::3])
+    scans = e57.read_scans([2, 0], workers=1)
+    assert np.array_equal(scans[0]["cartesianX"], expected[2]["cartesianX"])
+    # the blocks are laid out from the prototypes of the scans, with the types of read_scan
+    native = e57.read_scans([0, 1], workers=2, dtype_policy="native", transform=False)
+    assert native[0]["cartesianX"].dtype == e57.read_scan(0, dtype_policy="native", transform=False)["cartesianX"].dtype
+
+
+def test_read_scan_to_shared_memory_error(e57_path):
+    from multiprocessing import shared_memory
+    from pye57.e57 import _read_scan_to_shared_memory
+
+    e57 = pye57.E57(e57_path)
+    layout, size = e57._shared_memory_layout(0, {})
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        # the block is closed by the worker even though the traceback refers to its arrays
+        with pytest.raises(ValueError):
+            _read_scan_to_shared_memory(e57_path, pye57.libe57.CHECKSUM_POLICY_ALL, 0,
+                                        {"fields": ["missing"]}, shm.name, layout)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_read_scans_spherical(e57_spherical_path):
+    e57 = pye57.E57(e57_spherical_path)
+    expected = e57.read_scan(0)
+    data = e57.read_scans([0, 0], workers=2)[0]
+    assert list(data.keys()) == list(expected.keys())
+    for field in expected:
+        assert data[field].dtype == expected[field].dtype
+        assert np.array_equal(data[field], expected[field])
+
+
+def test_read_scan_range(e57_with_data_and_images_path):
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    raw = e57.read_scan_raw(0)
+    for start, stop in [(0, 10), (10, 25000), (25000, 25001), (40000, 120000), (100, 200), (155000, 200000)]:
+        data = e57.read_scan_range(0, start, stop, chunk_size=30000)
+        assert data.keys() == raw.keys()
+        for field in raw:
+            assert np.array_equal(data[field], raw[field][start:stop])
+    data = e57.read_scan_range(0, 500, 600, fields=["intensity"])
+    assert list(data.keys()) == ["intensity"]
+    assert np.array_equal(data["intensity"], raw["intensity"][500:600])
+    with pytest.raises(ValueError):
+        e57.read_scan_range(0, 10, 5)
+
+
+def test_header_cache(e57_path):
+    e57 = pye57.E57(e57_path)
+    header = e57.get_header(0)
+    assert e57.get_header(0) is header
+    assert e57.get_headers()[0] is header
+    rotation = header.rotation
+    rotation[0] = 42
+    assert not np.allclose(header.rotation, rotation)
+
+
+def test_header_snapshot(e57_path, temp_e57_write):
+    import pickle
+
+    e57 = pye57.E57(e57_path)
+    header = e57.get_header(0)
+    snapshot = pickle.loads(pickle.dumps(header.snapshot()))
+    assert snapshot.guid == header.guid
+    assert snapshot.point_count == header.point_count
+    assert snapshot.point_fields == tuple(header.point_fields)
+    assert snapshot.has_pose() == header.has_pose()
+    assert np.allclose(snapshot.rotation_matrix, header.rotation_matrix)
+    assert np.allclose(snapshot.translation, header.translation)
+    assert snapshot.xMaximum == header.xMaximum
+    assert not hasattr(snapshot, "rangeMinimum")
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        f.write_scan_raw(e57.read_scan_raw(0), scan_header=snapshot)
+        header_written = f.get_header(0)
+        assert header_written.xMaximum == header.xMaximum
+        assert header_written.intensityMinimum == header.intensityMinimum
+        assert np.allclose(header_written.rotation, header.rotation)
+
+
+def test_index_file(e57_path, e57_with_data_and_images_path, e57_with_normals_path, tmp_path):
+    e57 = pye57.E57(e57_path)
+    index = pye57.index_file(e57_path)
+    assert index["scan_count"] == e57.scan_count
+    assert index["guid"] == e57.root["guid"].value()
+    for scan, header in zip(index["scans"], e57.get_headers()):
+        assert scan["guid"] == header.guid
+        assert scan["point_count"] == header.point_count
+        assert list(scan["point_fields"]) == header.point_fields
+        assert scan["cartesianBounds"]["xMaximum"] == header.xMaximum
+        assert np.allclose(scan["rotation"], header.rotation)
+        assert np.allclose(scan["translation"], header.translation)
+
+    index = pye57.index_file(e57_with_data_and_images_path)
+    assert index["image_count"] == 1
+    scan = index["scans"][0]
+    assert scan["point_count"] == 155201
+    assert scan["point_fields"]["cartesianX"]["type"] == "ScaledInteger"
+    assert scan["point_fields"]["cartesianX"]["scale"] == 1e-06
+
+    index = pye57.index_file(e57_with_normals_path)
+    assert index["scans"][0]["point_fields"]["nor:normalX"] == {
+        "type": "Float", "precision": "single", "minimum": -1.0, "maximum": 1.0
+    }
+
+    copied_path = str(tmp_path / "copy.e57")
+    with open(e57_with_normals_path, "rb") as src, open(copied_path, "wb") as dst:
+        dst.write(src.read())
+    index = pye57.index_file(copied_path, cache=True)
+    assert os.path.exists(copied_path + ".index.json")
+    assert pye57.index_file(copied_path, cache=True) == index
+    # a modified file invalidates the cached index
+    with open(copied_path, "ab") as f:
+        f.write(b"\0" * 1024)
+    assert pye57.index_file(copied_path, cache=True)["size"] == index["size"] + 1024
+
+
+def test_checksum_policy(e57_path):
+    with pye57.E57(e57_path, checksum_policy="none") as e57:
+        assert e57.checksum_policy == libe57.CHECKSUM_POLICY_NONE
+        data_none = e57.read_scan_raw(0)
+    with pye57.E57(e57_path, checksum_policy=libe57.CHECKSUM_POLICY_HALF) as e57:
+        assert e57.checksum_policy == 50
+    with pye57.E57(e57_path) as e57:
+        assert e57.checksum_policy == libe57.CHECKSUM_POLICY_ALL
+        data_all = e57.read_scan_raw(0)
+    assert np.array_equal(data_none["cartesianX"], data_all["cartesianX"])
+    with pytest.raises(ValueError):
+        pye57.E57(e57_path, checksum_policy="some")
+    with pytest.raises(ValueError):
+        pye57.E57(e57_path, checksum_policy=101)
+
+
+def test_write_scan_raw_precision_and_scale(e57_with_data_and_images_path, temp_e57_write):
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    data = e57.read_scan_raw(0)
+    data["intensity"] = data["intensity"].astype("d") + 1e-9
+
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        f.write_scan_raw(data, precision="double", intensity_precision="double")
+    with pye57.E57(temp_e57_write) as f:
+        prototype = libe57.StructureNode(f.get_header(0).points.prototype())
+        assert prototype["cartesianX"].precision() == libe57.E57_DOUBLE
+        assert prototype["intensity"].precision() == libe57.E57_DOUBLE
+        data_double = f.read_scan_raw(0)
+    assert np.array_equal(data_double["cartesianX"], data["cartesianX"])
+    # double precision intensities are read without loss
+    assert data_double["intensity"].dtype == np.float64
+    assert np.array_equal(data_double["intensity"], data["intensity"])
+    size_double = os.path.getsize(temp_e57_write)
+
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        f.write_scan_raw(data, scale=0.0001)
+    with pye57.E57(temp_e57_write) as f:
+        header = f.get_header(0)
+        x_node = libe57.StructureNode(header.points.prototype())["cartesianX"]
+        assert isinstance(x_node, libe57.ScaledIntegerNode)
+        assert x_node.scale() == 0.0001
+        assert x_node.scaledMinimum() <= data["cartesianX"].min()
+        assert x_node.scaledMaximum() >= data["cartesianX"].max()
+        data_scaled = f.read_scan_raw(0)
+    for field in ["cartesianX", "cartesianY", "cartesianZ"]:
+        assert np.allclose(data_scaled[field], data[field], rtol=0, atol=0.00005 + 1e-9)
+    assert os.path.getsize(temp_e57_write) < size_double / 2
+
+    with pytest.raises(ValueError):
+        with pye57.E57(temp_e57_write, mode="w") as f:
+            f.write_scan_raw(data, precision="half")
+
+
+def test_scan_writer(e57_with_data_and_images_path, temp_e57_write):
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    header = e57.get_header(0)
+    data = e57.read_scan_raw(0)
+    fields = list(data)
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        f.write_scan_raw(data)
+        with f.scan_writer(fields, chunk_size=10000) as writer:
+            writer.write({field: data[field][:25000] for field in fields})
+            writer.write({field: data[field][25000:40000].astype("d") for field in fields})
+            writer.write({field: data[field][40000:] for field in fields})
+        with pytest.raises(ValueError):
+            writer.write(data)
+        limits = {field: (data[field].min(), data[field].max()) for field in ["cartesianX", "cartesianY", "cartesianZ"]}
+        with f.scan_writer(fields, scale=0.001, limits=limits) as writer:
+            for chunk in e57.iter_scan_raw(0, chunk_size=30000):
+                writer.write(chunk)
+        with pytest.raises(ValueError):
+            f.scan_writer(fields, scale=0.001)
+        f.scan_writer(fields).write_all({field: data[field][::2] for field in fields})
+
+    with pye57.E57(temp_e57_write) as f:
+        assert f.scan_count == 4
+        expected = f.get_header(0)
+        for index in range(1, 3):
+            written = f.get_header(index)
+            assert written.point_count == header.point_count
+            assert written.xMinimum == expected.xMinimum
+            assert written.zMaximum == expected.zMaximum
+            assert written.intensityMaximum == expected.intensityMaximum
+            assert written.rowMaximum == expected.rowMaximum
+            assert written.columnMinimum == expected.columnMinimum
+        streamed = f.read_scan_raw(1)
+        for field in fields:
+            assert np.array_equal(streamed[field], f.read_scan_raw(0)[field])
+        scaled = f.read_scan_raw(2)
+        assert np.allclose(scaled["cartesianX"], data["cartesianX"], rtol=0, atol=0.0005 + 1e-9)
+        assert np.array_equal(f.read_scan_raw(3)["cartesianY"], data["cartesianY"][::2].astype("f"))
+
+
+def test_scan_writer_error(e57_with_data_and_images_path, temp_e57_write):
+    data = pye57.E57(e57_with_data_and_images_path).read_scan_raw(0)
+    fields = list(data)
+    with pye57.E57(temp_e57_write, mode="w") as f:
+        with pytest.raises(RuntimeError):
+            with f.scan_writer(fields, chunk_size=10000) as writer:
+                writer.write({field: data[field][:15000] for field in fields})
+                raise RuntimeError("interrupted")
+        assert writer.closed
+
+    # the scan isn't finalized: the staged points are dropped, and there are no bounds
+    with pye57.E57(temp_e57_write) as f:
+        header = f.get_header(0)
+        assert header.point_count == 10000
+        assert not header.node.isDefined("cartesianBounds")
+        assert not header.node.isDefined("indexBounds")
+
+
+def test_clone(e57_path, e57_with_data_and_images_path, temp_e57_write):
+    pye57.clone(e57_with_data_and_images_path, temp_e57_write)
+    with pye57.E57(e57_with_data_and_images_path) as e57, pye57.E57(temp_e57_write) as cloned:
+        assert cloned.root["guid"].value() == e57.root["guid"].value()
+        data, data_cloned = e57.read_scan_raw(0), cloned.read_scan_raw(0)
+        for field in data:
+            assert np.array_equal(data[field], data_cloned[field])
+        image = e57.root["images2D"][0]["visualReferenceRepresentation"]["jpegImage"]
+        image_cloned = cloned.root["images2D"][0]["visualReferenceRepresentation"]["jpegImage"]
+        assert np.array_equal(image.read_buffer(), image_cloned.read_buffer())
+
+    rotation = Quaternion(axis=[0, 0, 1], angle=np.pi / 2)
+    translation = np.array([1.0, 2.0, 3.0])
+    pye57.clone(e57_path, temp_e57_write, scans=[2, 0], transform=(rotation.elements, translation))
+    with pye57.E57(e57_path) as e57, pye57.E57(temp_e57_write) as cloned:
+        assert cloned.scan_count == 2
+        for cloned_index, index in enumerate([2, 0]):
+            assert cloned.get_header(cloned_index).guid == e57.get_header(index).guid
+            xyz = e57.read_scan_xyz(index)
+            expected = rotation.rotation_matrix.dot(xyz.T).T + translation
+            assert np.allclose(cloned.read_scan_xyz(cloned_index), expected)
+
+
+def test_convert_spherical_to_cartesian():
+    from pye57.utils import convert_spherical_to_cartesian
+
+    rng = np.random.default_rng(0)
+    rae = np.column_stack([rng.uniform(0, 100, 1000), rng.uniform(-np.pi, np.pi, 1000), rng.uniform(-1, 1, 1000)])
+    r, theta, phi = rae.T
+    expected = np.column_stack([r * np.cos(phi) * np.cos(theta), r * np.cos(phi) * np.sin(theta), r * np.sin(phi)])
+    assert np.allclose(convert_spherical_to_cartesian(rae, block_size=64), expected)
+
+    rotation = Quaternion(axis=[1, 1, 0], angle=0.3)
+    translation = np.array([1.0, -2.0, 3.0])
+    in_place = rae.copy()
+    result = convert_spherical_to_cartesian(in_place, in_place, rotation_matrix=rotation.rotation_matrix,
+                                            translation=translation, block_size=100)
+    assert result is in_place
+    assert np.allclose(in_place, expected.dot(rotation.rotation_matrix.T) + translation)
+
+    result = convert_spherical_to_cartesian(rae.astype(np.float32))
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, atol=1e-3)
+    # a pose is applied in float64
+    assert convert_spherical_to_cartesian(rae.astype(np.float32), translation=translation).dtype == np.float64
+
+
+def test_filter_and_transform():
+    from pye57.utils import filter_and_transform
+
+    rng = np.random.default_rng(0)
+    rae = np.column_stack([rng.uniform(0, 100, 1000), rng.uniform(-np.pi, np.pi, 1000), rng.uniform(-1, 1, 1000)])
+    intensity = rng.random(1000).astype("f")
+    valid = rng.random(1000) > 0.3
+    rotation = Quaternion(axis=[0, 1, 1], angle=1.2)
+    translation = np.array([4.0, 5.0, 6.0])
+    r, theta, phi = rae[valid].T
+    expected = np.column_stack([r * np.cos(phi) * np.cos(theta), r * np.cos(phi) * np.sin(theta), r * np.sin(phi)])
+    expected = expected.dot(rotation.rotation_matrix.T) + translation
+
+    coordinates, (intensity_valid,) = filter_and_transform(list(rae.T), [intensity], valid, spherical=True,
+                                                           rotation_matrix=rotation.rotation_matrix,
+                                                           translation=translation, block_size=100)
+    assert np.allclose(np.column_stack(coordinates), expected)
+    assert np.array_equal(intensity_valid, intensity[valid])
+
+    # the valid points can be compacted in place
+    xyz = rae.copy()
+    columns = [xyz[:, i] for i in range(3)]
+    coordinates, _ = filter_and_transform(columns, (), valid, spherical=True, rotation_matrix=rotation.rotation_matrix,
+                                          translation=translation, out=columns, block_size=64)
+    assert coordinates[0].shape[0] == np.count_nonzero(valid)
+    assert np.allclose(xyz[:np.count_nonzero(valid)], expected)
+
+
+def test_decimation(e57_path):
+    e57 = pye57.E57(e57_path)
+    data = e57.read_scan(0, intensity=True)
+
+    strided = e57.read_scan(0, intensity=True, decimate=pye57.Stride(10))
+    for field in data:
+        assert np.array_equal(strided[field], data[field][::10])
+
+    size = 0.5
+    voxels = np.floor(np.column_stack([data["cartesianX"], data["cartesianY"], data["cartesianZ"]]) / size)
+    grid = e57.read_scan(0, intensity=True, decimate=pye57.VoxelGrid(size))
+    grid_voxels = np.floor(np.column_stack([grid["cartesianX"], grid["cartesianY"], grid["cartesianZ"]]) / size)
+    assert len(np.unique(grid_voxels, axis=0)) == grid_voxels.shape[0] == len(np.unique(voxels, axis=0))
+
+    sample = e57.read_scan(0, intensity=True, decimate=pye57.RandomSample(100, seed=1))
+    assert sample["cartesianX"].shape[0] == 100
+    assert np.array_equal(sample["intensity"], e57.read_scan(0, intensity=True,
+                                                             decimate=pye57.RandomSample(100, seed=1))["intensity"])
+    # the points are kept in the order of the scan, with their fields aligned
+    indices = np.searchsorted(data["cartesianX"], sample["cartesianX"], sorter=np.argsort(data["cartesianX"]))
+    indices = np.argsort(data["cartesianX"])[indices]
+    assert np.all(np.diff(indices) > 0)
+    assert np.array_equal(data["intensity"][indices], sample["intensity"])
+
+    # the decimators keep their state between chunks
+    chunks = [{field: array[start:start + 5000] for field, array in data.items()}
+              for start in range(0, data["cartesianX"].shape[0], 5000)]
+    for decimator in (pye57.Stride(10), pye57.VoxelGrid(size), pye57.RandomSample(100, seed=1)):
+        decimator.begin(data["cartesianX"].shape[0])
+        pieces = [decimator.filter(chunk) for chunk in chunks] + [decimator.end()]
+        chunked = np.concatenate([piece["cartesianX"] for piece in pieces if piece])
+        expected = e57.read_scan(0, intensity=True, decimate=decimator)["cartesianX"]
+        assert np.array_equal(chunked, expected)
+
+    class Incomplete(pye57.Decimator):
+        pass
+
+    # a decimator without 'filter' can't be created
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_query(e57_path, tmp_path):
+    path = str(tmp_path / "test.e57")
+    with open(e57_path, "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    e57 = pye57.E57(path)
+    # the scans are georeferenced
+    bbox = e57.get_header(1).translation + np.array([[-2, -3, -1], [2, 1, 1]])
+    result = e57.query(bbox, intensity=True, chunk_size=1000)
+    # the chunk bounds are only saved next to the file on request
+    assert not os.path.exists(path + ".chunks.json")
+    e57.query(bbox, chunk_size=1000, cache=True)
+    assert os.path.exists(path + ".chunks.json")
+    for index in range(e57.scan_count):
+        data = e57.read_scan(index, intensity=True)
+        xyz = np.column_stack([data["cartesianX"], data["cartesianY"], data["cartesianZ"]])
+        inside = np.all((xyz >= bbox[0]) & (xyz <= bbox[1]), axis=1)
+        assert np.array_equal(result[index]["cartesianX"], data["cartesianX"][inside])
+        assert np.array_equal(result[index]["intensity"], data["intensity"][inside])
+
+    # the chunk bounds are kept by the E57 object, the next queries only decode the chunks in the box
+    chunk_bounds = e57.chunk_bounds(1, 1000)
+    e57.chunk_bounds = None
+    e57._read_chunks = None
+    assert np.array_equal(e57.query(bbox, scans=[1], chunk_size=1000)[1]["cartesianX"], result[1]["cartesianX"])
+
+    # the chunk bounds are read from the cache
+    e57 = pye57.E57(path)
+    e57.chunk_bounds = None
+    assert np.array_equal(e57.query(bbox, scans=[1], chunk_size=1000, cache=True)[1]["cartesianX"],
+                          result[1]["cartesianX"])
+    assert np.array_equal(e57._chunk_bounds[(1, 1000)], chunk_bounds, equal_nan=True)
+    assert e57.query([[0, 0, 0], [1, 1, 1]], chunk_size=1000) == {}
+    with pytest.raises(ValueError):
+        e57.query([[1, 1, 1], [0, 0, 0]])
+
+
+def test_query_decodes_scans_once(e57_path, tmp_path):
+    path = str(tmp_path / "test.e57")
+    with open(e57_path, "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    with pye57.E57(path) as e57:
+        bbox = e57.get_header(1).translation + np.array([[-2, -3, -1], [2, 1, 1]])
+    for cache in [False, True]:
+        e57 = pye57.E57(path)
+        decoded = []
+        read_chunks, read_scan_range = e57._read_chunks, e57.read_scan_range
+
+        def counted_read_chunks(header, *args, **kwargs):
+            for chunk in read_chunks(header, *args, **kwargs):
+                decoded.append(next(iter(chunk.values())).shape[0])
+                yield chunk
+
+        def counted_read_scan_range(index, start, stop, **kwargs):
+            decoded.append(stop - start)
+            return read_scan_range(index, start, stop, **kwargs)
+
+        e57._read_chunks, e57.read_scan_range = counted_read_chunks, counted_read_scan_range
+        # on a cold cache, each scan is decoded once to compute its chunk bounds and find its points
+        e57.query(bbox, chunk_size=1000, cache=cache)
+        assert sum(decoded) == sum(header.point_count for header in e57.get_headers())
+        assert os.path.exists(path + ".chunks.json") == cache
+
+
+def test_read_scan_grid(e57_path):
+    e57 = pye57.E57(e57_path)
+    header = e57.get_header(0)
+    grid, valid = e57.read_scan_grid(0, intensity=True, chunk_size=10000)
+    assert valid.shape == (header.rowMaximum + 1, header.columnMaximum + 1)
+    assert set(grid) == {"cartesianX", "cartesianY", "cartesianZ", "intensity"}
+    assert grid["cartesianX"].shape == valid.shape
+
+    data = e57.read_scan(0, intensity=True, row_column=True)
+    assert np.count_nonzero(valid) == data["cartesianX"].shape[0]
+    assert np.array_equal(grid["cartesianX"][data["rowIndex"], data["columnIndex"]], data["cartesianX"])
+    assert np.array_equal(grid["intensity"][data["rowIndex"], data["columnIndex"]], data["intensity"])
+    assert np.all(np.isnan(grid["cartesianZ"][~valid]))
+
+
+def test_read_image(e57_with_data_and_images_path, e57_path):
+    e57 = pye57.E57(e57_with_data_and_images_path)
+    assert e57.image_count == 1
+    header = e57.get_image_header(0)
+    assert header.name == "pumpVisual"
+    assert header.image_format == "jpeg"
+    assert (header.imageWidth, header.imageHeight) == (3072, 2304)
+    expected = header.blob.read_buffer()
+
+    image = e57.read_image(0, chunk_size=100000)
+    assert bytes(image[:2]) == b"\xff\xd8"
+    assert np.array_equal(np.frombuffer(image, np.uint8), expected)
+    out = np.zeros(header.byte_count + 10, np.uint8)
+    e57.read_image(0, out=out)
+    assert np.array_equal(out[:header.byte_count], expected)
+    with pytest.raises(ValueError):
+        e57.read_image(0, out=bytearray(10))
+
+    chunks = [bytes(chunk) for chunk in e57.iter_image_chunks(0, chunk_size=100000)]
+    assert len(chunks) == -(-header.byte_count // 100000)
+    assert b"".join(chunks) == expected.tobytes()
+    assert [image_header.name for image_header, _ in e57.iter_images()] == ["pumpVisual"]
+
+    assert pye57.E57(e57_path).image_count == 0
+
+
+def test_read_all(e57_path):
+    e57 = pye57.E57(e57_path)
+    data = e57.read_all(intensity=True)
+    scans = [e57.read_scan(index, intensity=True) for index in range(e57.scan_count)]
+    assert data["scan_index"].dtype == np.uint8
+    assert data["cartesianX"].shape[0] == sum(scan["cartesianX"].shape[0] for scan in scans)
+    for field in ("cartesianX", "cartesianY", "cartesianZ", "intensity"):
+        assert np.array_equal(data[field], np.concatenate([scan[field] for scan in scans]))
+    assert np.array_equal(data["scan_index"],
+                          np.concatenate([np.full(scan["cartesianX"].shape[0], i) for i, scan in enumerate(scans)]))
+
+    subset = e57.read_all([2, 1], transform=False)
+    assert np.array_equal(np.unique(subset["scan_index"]), [1, 2])
+    assert np.array_equal(subset["cartesianX"][subset["scan_index"] == 1],
+                          e57.read_scan(1, transform=False)["cartesianX"])
+
+
+def test_disk_scan_cache(e57_path, tmp_path):
+    cache = pye57.DiskScanCache(tmp_path / "cache")
+    expected = pye57.E57(e57_path).read_scan(0, intensity=True)
+    e57 = pye57.E57(e57_path, cache=cache)
+    data = e57.read_scan(0, intensity=True)
+    assert isinstance(data["cartesianX"], np.memmap)
+    assert not data["cartesianX"].flags.writeable
+    for field in expected:
+        assert np.array_equal(data[field], expected[field])
+    raw = e57.read_scan_raw(0)
+    assert np.array_equal(raw["cartesianX"], pye57.E57(e57_path).read_scan_raw(0)["cartesianX"])
+
+    # the points are read from the cache, without decoding the scan
+    e57 = pye57.E57(e57_path, cache=cache)
+    e57.make_buffers = None
+    assert np.array_equal(e57.read_scan(0, intensity=True)["intensity"], expected["intensity"])
+    e57.read_scan_raw(0)
+    with pytest.raises(TypeError):
+        e57.read_scan(0, transform=False)
+
+    # the least recently used entries are removed
+    limited = pye57.DiskScanCache(tmp_path / "limited", max_bytes=cache.size - 1)
+    e57 = pye57.E57(e57_path, cache=limited)
+    e57.read_scan(0, intensity=True)
+    e57.read_scan_raw(0)
+    assert len(os.listdir(tmp_path / "limited")) == 1
+    assert 0 < limited.size < cache.size
+    assert np.array_equal(e57.read_scan_raw(0)["cartesianX"], raw["cartesianX"])
+
+    # entries left by a crashed process are removed, the ones being written are counted and kept
+    stale, writing = tmp_path / "limited" / ".tmp-stale", tmp_path / "limited" / ".tmp-writing"
+    for path in [stale, writing]:
+        path.mkdir()
+        (path / "0.npy").write_bytes(b"0" * 100)
+    old = time.time() - pye57.cache.STALE_TEMP_AGE - 1
+    os.utime(stale, (old, old))
+    size = limited.size
+    e57.read_scan(0)
+    assert not stale.exists()
+    assert writing.exists()
+    limited.clear()
+    assert os.listdir(tmp_path / "limited") == [".tmp-writing"]
+    assert limited.size == 100 < size
+
+
+def test_scan_cache(e57_path):
+    cache = pye57.ScanCache()
+    e57 = pye57.E57(e57_path, cache=cache)
+    data = e57.read_scan(0, intensity=True)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert not data["cartesianX"].flags.writeable
+    with pytest.raises(ValueError):
+        data["cartesianX"][0] = 0
+
+    # the same arrays are returned, without decoding the scan
+    e57.make_buffers = None
+    cached = e57.read_scan(0, intensity=True)
+    assert cached["cartesianX"] is data["cartesianX"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    del cached["intensity"]
+    assert "intensity" in e57.read_scan(0, intensity=True)
+    with pytest.raises(TypeError):
+        e57.read_scan(0, intensity=True, transform=False)
+
+    # the least recently used entries are removed
+    scan_bytes = sum(array.nbytes for array in data.values())
+    limited = pye57.ScanCache(max_bytes=scan_bytes)
+    e57 = pye57.E57(e57_path, cache=limited)
+    e57.read_scan(0, intensity=True)
+    e57.read_scan(0, intensity=True, transform=False)
+    assert (len(limited), limited.evictions) == (1, 1)
+    assert limited.size <= scan_bytes
+    e57.read_scan(0, intensity=True)
+    assert (limited.hits, limited.misses, limited.evictions) == (0, 3, 2)
+
+
+def test_async_e57(e57_path):
+    expected = pye57.E57(e57_path).read_scan(0, intensity=True)
+    state = {"decoded": 0, "closed": False}
+
+    async def read():
+        async with pye57.AsyncE57(e57_path) as e57:
+            data = await e57.aread_scan(0, intensity=True)
+            chunks = [chunk async for chunk in e57.aiter_scan(0, intensity=True, chunk_size=10000)]
+            with pytest.raises(ValueError):
+                [chunk async for chunk in e57.aiter_scan(0, fields=["missing"])]
+
+            iter_scan = e57.e57.iter_scan
+
+            def counted_iter_scan(*args, **kwargs):
+                try:
+                    for chunk in iter_scan(*args, **kwargs):
+                        state["decoded"] += 1
+                        yield chunk
+                finally:
+                    state["closed"] = True
+
+            # a slow consumer doesn't make the whole scan buffered, and stopping closes the reader
+            e57.e57.iter_scan = counted_iter_scan
+            chunks_iterator = e57.aiter_scan(0, chunk_size=1000, max_buffered_chunks=1)
+            await chunks_iterator.__anext__()
+            await asyncio.sleep(0.1)
+            decoded = state["decoded"]
+            await chunks_iterator.aclose()
+            assert state["closed"]
+
+            # closing the file stops the iterators of other tasks before their readers are closed
+            state["closed"] = False
+
+            async def consume():
+                async for _ in e57.aiter_scan(0, chunk_size=1000, max_buffered_chunks=1):
+                    await asyncio.sleep(0.01)
+
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.05)
+            await e57.aclose()
+            with pytest.raises(ValueError):
+                await consumer
+            assert state["closed"]
+            return data, chunks, decoded
+
+    data, chunks, decoded = asyncio.run(read())
+    for field in expected:
+        assert np.array_equal(data[field], expected[field])
+        assert np.array_equal(np.concatenate([chunk[field] for chunk in chunks]), expected[field])
+    # the chunk of the consumer, and the one decoded ahead of it
+    assert decoded <= 2
+    assert state["closed"]
+
+
+def test_read_scan_arrow(e57_path):
+    pa = pytest.importorskip("pyarrow")
+    e57 = pye57.E57(e57_path)
+    expected = e57.read_scan(0, intensity=True)
+    table = e57.read_scan_arrow(0, intensity=True)
+    assert table.column_names == list(expected)
+    for field in expected:
+        assert np.array_equal(table.column(field).to_numpy(), expected[field])
+    assert table.schema.field("cartesianX").metadata[b"unit"] == b"m"
+    assert table.schema.field("intensity").metadata[b"e57:type"] == b"Float"
+    metadata = table.schema.metadata
+    assert metadata[b"e57:guid"].decode() == e57.get_header(0).guid
+    assert json.loads(metadata[b"e57:cartesianBounds"])["xMinimum"] == e57.get_header(0).xMinimum
+
+    # the columns wrap the decoded arrays
+    data = e57.read_scan(0)
+    batch = pye57.arrow.record_batch(data, pye57.arrow.scan_schema(e57.get_header(0), 0, data))
+    assert batch.column("cartesianX").buffers()[1].address == data["cartesianX"].ctypes.data
+
+    reader = e57.to_record_batches(0, chunk_size=10000, intensity=True)
+    assert reader.schema == table.schema
+    batches = list(reader)
+    # the invalid points of each chunk are removed
+    assert len(batches) > 1 and max(batch.num_rows for batch in batches) <= 10000
+    assert pa.Table.from_batches(batches).equals(table)